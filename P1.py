@@ -88,186 +88,9 @@ plt.imshow(image)  # if you wanted to show a single color channel image called '
 # In[3]:
 
 
-import math
-
-def grayscale(img):
-    """Applies the Grayscale transform
-    This will return an image with only one color channel
-    but NOTE: to see the returned image as grayscale
-    (assuming your grayscaled image is called 'gray')
-    you should call plt.imshow(gray, cmap='gray')"""
-    return cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-    # Or use BGR2GRAY if you read an image with cv2.imread()
-    # return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-def canny(img, low_threshold, high_threshold):
-    """Applies the Canny transform"""
-    return cv2.Canny(img, low_threshold, high_threshold)
-
-def gaussian_blur(img, kernel_size):
-    """Applies a Gaussian Noise kernel"""
-    return cv2.GaussianBlur(img, (kernel_size, kernel_size), 0)
-
-def region_of_interest(img, vertices):
-    """
-    Applies an image mask.
-
-    Only keeps the region of the image defined by the polygon
-    formed from `vertices`. The rest of the image is set to black.
-    """
-    #defining a blank mask to start with
-    mask = np.zeros_like(img)
-
-    #defining a 3 channel or 1 channel color to fill the mask with depending on the input image
-    if len(img.shape) > 2:
-        channel_count = img.shape[2]  # i.e. 3 or 4 depending on your image
-        ignore_mask_color = (255,) * channel_count
-    else:
-        ignore_mask_color = 255
-
-    #filling pixels inside the polygon defined by "vertices" with the fill color
-    cv2.fillPoly(mask, vertices, ignore_mask_color)
-
-    #returning the image only where mask pixels are nonzero
-    masked_image = cv2.bitwise_and(img, mask)
-    return masked_image
-
-
-def draw_lines(img, lines, color=[255, 0, 0], thickness=10):
-    """
-    NOTE: this is the function you might want to use as a starting point once you want to
-    average/extrapolate the line segments you detect to map out the full
-    extent of the lane (going from the result shown in raw-lines-example.mp4
-    to that shown in P1_example.mp4).
-
-    Think about things like separating line segments by their
-    slope ((y2-y1)/(x2-x1)) to decide which segments are part of the left
-    line vs. the right line.  Then, you can average the position of each of
-    the lines and extrapolate to the top and bottom of the lane.
-
-    This function draws `lines` with `color` and `thickness`.
-    Lines are drawn on the image inplace (mutates the image).
-    If you want to make the lines semi-transparent, think about combining
-    this function with the weighted_img() function below
-    """
-    imgshape = img.shape
-    # get y coordinate of the highest point for future use
-    top_y_coordinate = imgshape[0]
-
-    # step 1: calculate a slope for one of the longest line segments
-
-    # to get a more accurate slope, find the longest line segment first
-    longest_line = np.array([[0, 0, 0, 0]])
-    for line in lines:
-        x1_ll, y1_ll, x2_ll, y2_ll = longest_line[0][0], longest_line[0][1], \
-            longest_line[0][2], longest_line[0][3]
-        for x1, y1, x2, y2 in line:
-            if (x1 - x2) ** 2 + (y1 - y2) ** 2 > (x1_ll - x2_ll) ** 2 + (y1_ll - y2_ll) ** 2:
-                longest_line = line
-    # now calculate slope for one side, call it sample side
-    # line in lines is a nested np.array like [[1,2,3,4]]
-    line_sample = longest_line[0]
-    x1, y1, x2, y2 = line_sample[0], line_sample[1], line_sample[2], line_sample[3]
-    slope_sample = (y2 - y1) / (x2 - x1)
-    # find the middle point of the longest line for the sample side, extract the resulting nested array
-    # we will user the point to calculate the interception point for y = m * x + b
-    # same goes for the other side
-    mid_point_sample = [np.array([abs((x2 - x1) / 2) + min(x1, x2), abs((y2 - y1) / 2) + min(y1, y2)]) \
-        for (x1, y1, x2, y2) in longest_line][0]
-
-    # step2: classify all lines to two groups, according to the slope we find in step 1
-    #
-    # seperate lines to two sides, respectively, base on the slope
-    lines_on_sample_side = []
-    lines_on_other_side = []
-    for line in lines:
-        for x1, y1, x2, y2 in line:
-            if y1 < top_y_coordinate:
-                top_y_coordinate = y1
-            if y2 < top_y_coordinate:
-                top_y_coordinate = y2
-            if abs(slope_sample - (y2 - y1) / (x2 - x1)) < 0.15:
-                lines_on_sample_side.append(line)
-            else:
-                lines_on_other_side.append(line)
-    lines_on_sample_side = np.array(lines_on_sample_side)
-    lines_on_the_other_side = np.array(lines_on_other_side)
-    # step 3:
-    # calculate the slope for the other side
-    # first find the longest line for the other side
-    longest_line = np.array([[0, 0, 0, 0]])
-    for line in lines_on_other_side:
-        x1_ll, y1_ll, x2_ll, y2_ll = longest_line[0][0], longest_line[0][1], \
-            longest_line[0][2], longest_line[0][3]
-        for x1, y1, x2, y2 in line:
-            if (x1 - x2) ** 2 + (y1 - y2) ** 2 > (x1_ll - x2_ll) ** 2 + (y1_ll - y2_ll) ** 2:
-                longest_line = line
-    # get the longest line from the other side and calculate the slope
-    line_other = longest_line[0]
-    x1, y1, x2, y2 = line_other[0], line_other[1], line_other[2], line_other[3]
-    slope_other = (y2 - y1) / (x2 - x1)
-    # find the middle point of the longest line for the other side, extract the resulting nested array
-    # we will user the point to calculate the interception point for y = m * x + b
-    # same goes for the other side
-    mid_point_other = [np.array([abs((x2 - x1) / 2) + min(x1, x2), abs((y2 - y1) / 2) + min(y1, y2)]) \
-        for (x1, y1, x2, y2) in longest_line][0]
-
-    # step 4: find the top point and bottom point for both sides
-    # and connect each pair to form a single long line for each side
-
-    # to find the bottom point and the top point for the sample side
-    # first find b in y = m * x + b
-    interception_sample_line = mid_point_sample[1] - slope_sample * mid_point_sample[0]
-    # for bottom point we already know the y coordinate
-    bottom_x_sample_side = (imgshape[0] - interception_sample_line) / slope_sample
-    bottom_point_sample_side = np.array([bottom_x_sample_side, imgshape[0]])
-    # find point with smallest y coordinate thus the highest point of both side
-    # we now have the y coordinate, now find x coordinate
-    top_x_sample_side = (top_y_coordinate - interception_sample_line) / slope_sample
-    # now combine top and bottom points to form a longest line segment
-    line_sample_side = [np.append(bottom_point_sample_side, [top_x_sample_side, top_y_coordinate])]
-    # now for the other side
-    interception_other_line = mid_point_other[1] - slope_other * mid_point_other[0]
-    bottom_x_other_side = (imgshape[0] - interception_other_line) / slope_other
-    bottom_point_other_side = np.array([bottom_x_other_side, imgshape[0]])
-
-    top_x_other_side = (top_y_coordinate - interception_other_line) / slope_other
-    line_other_side = [np.append(bottom_point_other_side, [top_x_other_side, top_y_coordinate])]
-
-    # step 5: combine the two lines and draw them on the image
-
-    # two_lines is of the form [[1,2,3],[4,5,6]]
-    two_lines = np.array([line_sample_side, line_other_side])
-    for line in two_lines.astype(int):
-        for x1,y1,x2,y2 in line:
-            cv2.line(img, (x1, y1), (x2, y2), color, thickness)
-
-def hough_lines(img, rho, theta, threshold, min_line_len, max_line_gap):
-    """
-    `img` should be the output of a Canny transform.
-
-    Returns an image with hough lines drawn.
-    """
-    lines = cv2.HoughLinesP(img, rho, theta, threshold, np.array([]), minLineLength=min_line_len, maxLineGap=max_line_gap)
-    line_img = np.zeros((img.shape[0], img.shape[1], 3), dtype=np.uint8)
-    draw_lines(line_img, lines)
-    return line_img
-
-# Python 3 has support for cool math symbols.
-
-def weighted_img(img, initial_img, α=0.8, β=1., λ=0.):
-    """
-    `img` is the output of the hough_lines(), An image with lines drawn on it.
-    Should be a blank image (all black) with lines drawn on it.
-
-    `initial_img` should be the image before any processing.
-
-    The result image is computed as follows:
-
-    initial_img * α + img * β + λ
-    NOTE: initial_img and img must be the same shape!
-    """
-    return cv2.addWeighted(initial_img, α, img, β, λ)
+# The helper functions live in `lanefind/pipeline.py`, so that they can be imported outside of this notebook.
+from lanefind import (grayscale, canny, gaussian_blur, roi_mask, region_of_interest, roi_bounding_box,
+                      fit_lane_lines, draw_lines, draw_lines_iterative, hough_lines, weighted_img)
 
 
 # ## Test Images
@@ -334,6 +157,12 @@ for line_marked_img in line_marked_imgs:
 
 for idx in range(len(image_files)):
     mpimg.imsave(image_files[idx] + "line_marked.jpg", line_marked_imgs[idx])
+
+
+# ## Benchmark draw_lines()
+#
+# `draw_lines()` fits both lane lines with NumPy operations over the whole `lines` array, `draw_lines_iterative()` is the original loop based version. `python benchmarks/draw_lines.py` checks that both give nearly the same lines on the test images (their end points at most 20 pixels apart) and times them on synthetic Hough output with a growing number of segments.
+
 # ## Test on Videos
 #
 # You know what's cooler than drawing lanes over images? Drawing lanes over video!
@@ -365,37 +194,63 @@ from IPython.display import HTML
 # In[ ]:
 
 
-def process_image(image):
-    # NOTE: The output you return should be a color image (3 channel) for processing video below
-    # TODO: put your pipeline here,
-    # you should return the final output (image where lines are drawn on lanes)
-    gray = grayscale(image)
+# process_image() is in `lanefind/pipeline.py` too
+from lanefind import process_image
+
+
+# The region of interest mask only depends on the frame shape, so `region_of_interest()` rasterizes it once per resolution and reuses it from `roi_mask()`. With `crop_to_roi=True`, `process_image()` also cuts the frame down to the bounding box of the region before Canny and Hough. The box keeps a margin around the region for the blur and for the hysteresis of Canny, which follows weak edges across the border of the box, and with it the edge maps of the test images are the same as on the full frame. `cv2.HoughLinesP()` is probabilistic though, and samples the same edges in another order in a smaller image, so the lane lines of the crop still move, by up to 29 px on the test images.
+
+# In[ ]:
+
+
+import timeit
+
+for image_file, image in zip(image_files, images):
+    full_frame_time = timeit.timeit(lambda: process_image(image), number=20) / 20
+    cropped_time = timeit.timeit(lambda: process_image(image, crop_to_roi=True), number=20) / 20
+    print('{}: full frame {:.2f} ms, cropped to the region of interest {:.2f} ms'.format(
+        image_file, full_frame_time * 1e3, cropped_time * 1e3))
+print(roi_mask.cache_info())
+
+
+# ## Track the lanes across frames
+#
+# `process_image()` finds the lanes in every frame from scratch. In a video the lanes barely move from one frame to the next, so `LaneTracker` keeps the lines of the previous frames, smooths them, and only searches a thin band around each line while it is confident about both of them. When a side is not found, its last line is kept instead of failing.
+
+# In[ ]:
+
+
+# LaneTracker is in `lanefind/tracker.py`
+from lanefind import LaneTracker
 
-    kernel_size = 5
-    blur_gray = gaussian_blur(gray, kernel_size)
 
-    low_threshold = 50
-    high_threshold = 150
-    edges = canny(blur_gray, low_threshold, high_threshold)
+# `clip.fl_image(process_image)` decodes, processes and encodes one frame at a time on a single core. `process_frames()` below streams the frames through a pool of worker processes instead: one thread decodes the frames into a bounded queue, the workers run `process_image()`, and a reorder buffer hands the processed frames back in their original order. `process_video()` feeds the result to the encoder and reports the end-to-end frames/sec.
 
-    imshape = image.shape
-    vertices = np.array([[(145, imshape[0]), (445, 320), (540, 320),
-                              (imshape[1], imshape[0])]], dtype=np.int32)
+# In[ ]:
 
-    masked_edges = region_of_interest(edges, vertices)
 
-    rho = 2
-    theta = np.pi / 180
-    threshold = 15
-    min_line_length = 40
-    max_line_gap = 20
+import multiprocessing
 
-    line_img = hough_lines(masked_edges, rho, theta, threshold,
-                         min_line_length, max_line_gap)
+# process_frames() and process_video() are in `lanefind/video.py`
+from lanefind import process_frames, process_video
 
-    line_marked_img = weighted_img(line_img, image)
-    result = line_marked_img
-    return result
+
+# ## Process a directory of images
+#
+# The test images cell above keeps every image and every intermediate result in memory. For large directories of frames, `process_directory()` streams the files through a pool of worker processes instead, and each worker saves its result as soon as it is ready.
+
+# In[ ]:
+
+
+# process_directory() is in `lanefind/batch.py`, and runs as `lanefind dir test_images/ test_images_output/` from the command line
+from lanefind import process_directory
+
+
+# In[ ]:
+
+
+for output_file in process_directory("test_images/", "test_images_output/"):
+    print(output_file)
 
 
 # Let's try the one with the solid white lane on the right first ...
@@ -410,8 +265,7 @@ white_output = 'test_videos_output/solidWhiteRight.mp4'
 ## You may also uncomment the following line for a subclip of the first 5 seconds
 ##clip1 = VideoFileClip("test_videos/solidWhiteRight.mp4").subclip(0,5)
 clip1 = VideoFileClip("test_videos/solidWhiteRight.mp4")
-white_clip = clip1.fl_image(process_image) #NOTE: this function expects color images!!
-get_ipython().magic('time white_clip.write_videofile(white_output, audio=False)')
+get_ipython().magic('time process_video(clip1, white_output)')  #NOTE: this function expects color images!!
 
 
 # Play the video inline, or if you prefer find the video in your filesystem (should be in the same directory) and play it in your video player of choice.
@@ -426,6 +280,31 @@ HTML("""
 """.format(white_output))
 
 
+# The streaming pipeline must give exactly the frames of the serial path, and its frames/sec should grow close to linearly with the number of workers.
+
+# In[ ]:
+
+
+frames = list(VideoFileClip("test_videos/solidWhiteRight.mp4").subclip(0, 2).iter_frames())
+print('matches the serial path:', all(np.array_equal(process_image(frame), parallel_frame)
+                                      for frame, parallel_frame in zip(frames, process_frames(frames))))
+
+for video in ["test_videos/solidWhiteRight.mp4", "test_videos/solidYellowLeft.mp4", "test_videos/challenge.mp4"]:
+    for workers in sorted({1, 2, 4, multiprocessing.cpu_count()}):
+        process_video(video, 'test_videos_output/scaling.mp4', workers=workers)
+
+
+# The tracker needs the frames in order, so it runs on a single worker. Compare its frames/sec with the stateless `process_image()` above.
+
+# In[ ]:
+
+
+tracker = LaneTracker()
+tracked_output = 'test_videos_output/solidWhiteRight_tracked.mp4'
+get_ipython().magic('time process_video("test_videos/solidWhiteRight.mp4", tracked_output, tracker.process_image, workers=1)')
+process_video("test_videos/solidWhiteRight.mp4", 'test_videos_output/scaling.mp4', workers=1)
+
+
 # ## Improve the draw_lines() function
 #
 # **At this point, if you were successful with making the pipeline and tuning parameters, you probably have the Hough line segments drawn onto the road, but what about identifying the full extent of the lane and marking it clearly as in the example video (P1_example.mp4)?  Think about defining a line to run the full length of the visible lane based on the line segments you identified with the Hough Transform. As mentioned previously, try to average and/or extrapolate the line segments you've detected to map out the full extent of the lane lines. You can see an example of the result you're going for in the video "P1_example.mp4".**
@@ -444,8 +323,7 @@ yellow_output = 'test_videos_output/solidYellowLeft.mp4'
 ## You may also uncomment the following line for a subclip of the first 5 seconds
 ##clip2 = VideoFileClip('test_videos/solidYellowLeft.mp4').subclip(0,5)
 clip2 = VideoFileClip('test_videos/solidYellowLeft.mp4')
-yellow_clip = clip2.fl_image(process_image)
-get_ipython().magic('time yellow_clip.write_videofile(yellow_output, audio=False)')
+get_ipython().magic('time process_video(clip2, yellow_output)')
 
 
 # In[ ]:
@@ -477,8 +355,7 @@ challenge_output = 'test_videos_output/challenge.mp4'
 ## You may also uncomment the following line for a subclip of the first 5 seconds
 ##clip3 = VideoFileClip('test_videos/challenge.mp4').subclip(0,5)
 clip3 = VideoFileClip('test_videos/challenge.mp4')
-challenge_clip = clip3.fl_image(process_image)
-get_ipython().magic('time challenge_clip.write_videofile(challenge_output, audio=False)')
+get_ipython().magic('time process_video(clip3, challenge_output)')
 
 
 # In[ ]:
@@ -0,0 +1,104 @@
+"""
+Times adaptive frame skipping against detecting the lanes on every frame.
+
+Renders a synthetic drive: a steady road, a lane change where the lines
+sweep sideways, and a steady road again. Runs FrameProcessor on every frame,
+then AdaptiveLaneFinder at each accuracy budget, extrapolating the skipped
+frames (as `lanefind video --adaptive` does) and interpolating them (as
+`lanefind lanes --adaptive` does). Reports the detection rate, overall and
+on the lane change, ms per frame, the speedup, and the p95 and largest
+distance of the lines from the lines the frames were drawn with, as a
+fraction of the frame height. Fails when the p95 distance is more than the
+budget over that of detecting every frame.
+
+    python benchmarks/adaptive.py [--frames 200] [--resolution 540p] [--budgets 0.01 0.02 0.05]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from lanefind.adaptive import AdaptiveLaneFinder
+from lanefind.config import DEFAULT_CONFIG
+from lanefind.pipeline import lane_line_errors, left_right_lines
+from lanefind.processor import FrameProcessor
+from lanefind.synthetic import RESOLUTIONS, synthetic_frame, synthetic_lane_lines
+
+
+def drive_shifts(frame_count):
+    """The sideways shift of the lanes on every frame: steady, a lane change over a fifth of the frames, steady"""
+    start, length = int(0.4 * frame_count), max(frame_count // 5, 1)
+    progress = np.clip((np.arange(frame_count) - start) / length, 0, 1)
+    # smooth in and out of the lane change
+    return 0.12 * (1 - np.cos(np.pi * progress)) / 2, (start, start + length)
+
+
+def timed(lane_lines, frames):
+    """Returns the lines `lane_lines(frames)` yields for every frame, and the ms per frame"""
+    start = time.perf_counter()
+    lines = np.array([lines.copy() for lines in lane_lines(frames)])
+    return lines, (time.perf_counter() - start) / len(frames) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--frames', type=int, default=200, help='frames of the drive (default: %(default)s)')
+    parser.add_argument('--resolution', choices=RESOLUTIONS, default='540p', help='(default: %(default)s)')
+    parser.add_argument('--budgets', type=float, nargs='+', default=[0.01, 0.02, 0.05],
+                        help='accuracy budgets, as fractions of the frame height (default: %(default)s)')
+    parser.add_argument('--max-interval', type=int, default=10, help='(default: %(default)s)')
+    args = parser.parse_args()
+
+    width, height = RESOLUTIONS[args.resolution]
+    shifts, (change_start, change_end) = drive_shifts(args.frames)
+    # no clutter: on cluttered frames the detection of the dashed line jitters by more than the budgets
+    frames = [synthetic_frame(width, height, clutter=0, shift=shift, seed=index)
+              for index, shift in enumerate(shifts)]
+    truth = np.array([synthetic_lane_lines(width, height, shift) for shift in shifts])
+    top_y = height * min(y for _, y in DEFAULT_CONFIG.roi)
+
+    processor = FrameProcessor()
+    reference, reference_ms = timed(lambda frames: (left_right_lines(processor.find_lane_lines(frame))
+                                                    for frame in frames), frames)
+    errors = lane_line_errors(reference, truth, height, top_y).max(axis=1)
+    reference_p95 = np.percentile(errors, 95)
+    print('{:<67} {:>8.2f} ms/frame         error p95 {:.4f}, max {:.4f}'.format(
+        'detect every frame', reference_ms, reference_p95, errors.max()))
+
+    failed = False
+    for budget in args.budgets:
+        for mode in ('extrapolate', 'interpolate'):
+            finder = AdaptiveLaneFinder(budget, max_interval=args.max_interval)
+            detected = []
+
+            def counted(frames):
+                # whether the finder ran the detection on each frame
+                for frame in frames:
+                    detections = finder.detections
+                    yield frame
+                    detected.append(finder.detections > detections)
+
+            if mode == 'interpolate':
+                lane_lines = lambda frames: finder.lane_lines(counted(frames))
+            else:
+                lane_lines = lambda frames: (finder.find_lane_lines(frame) for frame in counted(frames))
+            lines, ms = timed(lane_lines, frames)
+            errors = lane_line_errors(lines, truth, height, top_y).max(axis=1)
+            p95 = np.percentile(errors, 95)
+            over = p95 > reference_p95 + budget
+            failed |= over
+            print('budget {:<6.3f} {:<12} detection {:>4.0%}, {:>4.0%} in the lane change  {:>8.2f} ms/frame '
+                  '{:>5.1f}x  error p95 {:.4f}, max {:.4f}{}'.format(
+                      budget, mode, finder.detection_rate, np.mean(detected[change_start:change_end]), ms,
+                      reference_ms / ms, p95, errors.max(), '  OVER BUDGET' if over else ''))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Compares process_image() with the preallocated buffers of FrameProcessor.
+
+For the test images and for synthetic frames at 1080p and 4K, reports the
+bytes each stage allocates per frame (as traced by tracemalloc, which sees
+the NumPy arrays OpenCV returns), and the p50/p95 latency per frame without
+tracing. Also checks that both give the same images.
+
+    python benchmarks/buffers.py [--frames N]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+
+from lanefind import profiling
+from lanefind.pipeline import process_image
+from lanefind.processor import FrameProcessor
+from lanefind.synthetic import RESOLUTIONS, synthetic_frame
+
+
+def case_frames():
+    """Returns {case name: list of RGB frames}"""
+    image_dir = os.path.join(ROOT, 'test_images')
+    cases = {'test_images': [cv2.cvtColor(cv2.imread(os.path.join(image_dir, file_name)), cv2.COLOR_BGR2RGB)
+                             for file_name in sorted(os.listdir(image_dir))]}
+    for resolution in ('1080p', '4K'):
+        width, height = RESOLUTIONS[resolution]
+        cases[resolution] = [synthetic_frame(width, height, 100, shift=0.01 * seed, seed=seed) for seed in range(3)]
+    return cases
+
+
+def allocations(frame_function, frames):
+    """Returns {stage: mean bytes allocated per frame} of `frame_function` over `frames`"""
+    profiler = profiling.enable(track_allocations=True)
+    for frame in frames:
+        frame_function(frame)
+    profiling.disable()
+    return {column[:-len('_bytes')]: stats['mean'] for column, stats in profiler.summary().items()
+            if column.endswith('_bytes')}
+
+
+def latency(frame_function, frames, frame_count):
+    """Returns the p50 and p95 milliseconds per frame of `frame_function`"""
+    times = []
+    for index in range(frame_count):
+        start = time.perf_counter()
+        frame_function(frames[index % len(frames)])
+        times.append((time.perf_counter() - start) * 1e3)
+    return np.percentile(times, [50, 95])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--frames', type=int, default=60, help='timed frames per run (default: %(default)s)')
+    args = parser.parse_args()
+
+    for name, frames in case_frames().items():
+        processor = FrameProcessor()
+        # the first frame of a shape allocates the buffers
+        for frame in frames:
+            if not np.array_equal(process_image(frame), processor.process_image(frame)):
+                sys.exit('{}: FrameProcessor and process_image() give different images'.format(name))
+
+        print('{} {}x{}'.format(name, frames[0].shape[1], frames[0].shape[0]))
+        allocated = {'process_image': allocations(process_image, frames),
+                     'FrameProcessor': allocations(processor.process_image, frames)}
+        for stage in allocated['process_image']:
+            print('  {:<20} {:>12,.0f} -> {:>10,.0f} bytes per frame'.format(
+                stage, allocated['process_image'][stage], allocated['FrameProcessor'].get(stage, 0)))
+        old = latency(process_image, frames, args.frames)
+        new = latency(processor.process_image, frames, args.frames)
+        print('  {:<20} p50 {:>7.2f} -> {:>7.2f} ms  p95 {:>7.2f} -> {:>7.2f} ms  ({:.2f}x)'.format(
+            'latency', old[0], new[0], old[1], new[1], old[0] / new[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Measures the white and yellow color prefilter of the pipeline.
+
+Runs find_lane_lines() with and without PipelineConfig(color_filter=True) on
+the test images and on synthetic 720p frames with more and more road clutter,
+and reports per frame the edge pixels left in the region of interest (and
+the reduction ratio), the Hough segments, and the p50 time of Hough and of
+the whole frame. For the synthetic frames it also reports how far the lane
+lines are from the painted ones.
+
+    python benchmarks/color_filter.py [--frames N]
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+
+from lanefind import profiling
+from lanefind.config import PipelineConfig
+from lanefind.pipeline import find_lane_lines, left_right_lines
+from lanefind.synthetic import RESOLUTIONS, synthetic_frame, synthetic_lane_lines
+
+CLUTTER = {'clean': 0, 'cluttered': 100, 'busy': 400}
+
+
+def line_error(two_lines, truth, imshape):
+    """Returns the largest horizontal distance between the lane lines and `truth`, at the bottom and the top"""
+    error = 0.
+    for line, true_line in zip(left_right_lines(two_lines), truth):
+        if np.isnan(line).any():
+            return float('inf')
+        for y in (imshape[0] - 1, true_line[3]):
+            x, true_x = [x1 + (x2 - x1) * (y - y1) / (y2 - y1) for x1, y1, x2, y2 in (line, true_line)]
+            error = max(error, abs(x - true_x))
+    return error
+
+
+def run(frames, config, frame_count):
+    """Returns the profiling summary of `frame_count` frames, and the lane lines of each of `frames`"""
+    lines = [find_lane_lines(frame, config=config) for frame in frames]
+    profiler = profiling.enable()
+    for index in range(frame_count):
+        find_lane_lines(frames[index % len(frames)], config=config)
+    profiling.disable()
+    return profiler.summary(), lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--frames', type=int, default=30, help='timed frames per run (default: %(default)s)')
+    args = parser.parse_args()
+
+    image_dir = os.path.join(ROOT, 'test_images')
+    cases = {'test_images': [cv2.cvtColor(cv2.imread(os.path.join(image_dir, file_name)), cv2.COLOR_BGR2RGB)
+                             for file_name in sorted(os.listdir(image_dir))]}
+    width, height = RESOLUTIONS['720p']
+    for density, clutter in CLUTTER.items():
+        cases['720p-' + density] = [synthetic_frame(width, height, clutter, seed=seed) for seed in range(3)]
+
+    print('{:<16} {:<8} {:>12} {:>10} {:>10} {:>10} {:>12}'.format(
+        'case', 'filter', 'edge pixels', 'segments', 'hough ms', 'total ms', 'line error'))
+    for name, frames in cases.items():
+        edge_pixels = None
+        for color_filter in (False, True):
+            summary, lines = run(frames, PipelineConfig(color_filter=color_filter), args.frames)
+            if name == 'test_images':
+                error = ''
+            else:
+                truth = synthetic_lane_lines(width, height)
+                error = '{:.1f} px'.format(max(line_error(two_lines, truth, (height, width)) for two_lines in lines))
+            pixels = summary['edge_pixels']['mean']
+            reduction = '' if edge_pixels is None else ' ({:.0%} fewer)'.format(1 - pixels / edge_pixels)
+            edge_pixels = edge_pixels or pixels
+            print('{:<16} {:<8} {:>12.0f} {:>10.0f} {:>10.2f} {:>10.2f} {:>12}{}'.format(
+                name, 'on' if color_filter else 'off', pixels, summary['segments']['mean'],
+                summary['hough_ms']['p50'], summary['total_ms']['p50'], error, reduction))
+
+
+if __name__ == '__main__':
+    main()
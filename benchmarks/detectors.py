@@ -0,0 +1,87 @@
+"""
+Compares the line detectors of the pipeline for speed and accuracy.
+
+Runs find_lane_lines() with PipelineConfig(detector=NAME) for every detector
+of lanefind.detectors on the test images and on a synthetic 720p drive with
+more and more road clutter, and reports per frame the segments, and the p50
+time of the detector (the `hough` stage) and of the whole frame. The lines
+of the test images are compared with those of cv2.HoughLinesP(), the lines
+of the synthetic frames with the lines they were drawn with, by their
+largest and mean distance at the bottom of the frame and at the top of the
+region of interest, in pixels. Exits with status 1 when a detector is more
+than --tolerance of the frame height from HoughLinesP on the test images.
+
+    python benchmarks/detectors.py [--frames N] [--detector NAME] [--tolerance 0.05]
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+
+from lanefind import profiling
+from lanefind.config import DEFAULT_CONFIG, PipelineConfig
+from lanefind.detectors import DETECTORS
+from lanefind.pipeline import find_lane_lines, lane_line_errors, left_right_lines
+from lanefind.synthetic import RESOLUTIONS, synthetic_frame, synthetic_lane_lines
+
+CLUTTER = {'clean': 0, 'cluttered': 100, 'busy': 400}
+
+
+def run(frames, config, frame_count):
+    """Returns the profiling summary of `frame_count` frames, and the [left, right] lane lines of each of `frames`"""
+    lines = np.array([left_right_lines(find_lane_lines(frame, config=config)) for frame in frames])
+    profiler = profiling.enable()
+    for index in range(frame_count):
+        find_lane_lines(frames[index % len(frames)], config=config)
+    profiling.disable()
+    return profiler.summary(), lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--frames', type=int, default=30, help='timed frames per run (default: %(default)s)')
+    parser.add_argument('--detector', action='append', choices=DETECTORS,
+                        help='only run this detector and houghp, can be repeated')
+    parser.add_argument('--tolerance', type=float, default=0.05,
+                        help='largest distance from HoughLinesP on the test images, as a fraction of the frame '
+                             'height (default: %(default)s)')
+    args = parser.parse_args()
+    detectors = ['houghp'] + [name for name in args.detector or DETECTORS if name != 'houghp']
+
+    image_dir = os.path.join(ROOT, 'test_images')
+    cases = {'test_images': ([cv2.cvtColor(cv2.imread(os.path.join(image_dir, file_name)), cv2.COLOR_BGR2RGB)
+                              for file_name in sorted(os.listdir(image_dir))], None)}
+    width, height = RESOLUTIONS['720p']
+    shifts = 0.002 * np.arange(10)
+    for density, clutter in CLUTTER.items():
+        cases['720p-' + density] = (
+            [synthetic_frame(width, height, clutter, shift=shift, seed=index) for index, shift in enumerate(shifts)],
+            np.array([synthetic_lane_lines(width, height, shift) for shift in shifts]))
+
+    print('{:<16} {:<16} {:>10} {:>10} {:>10} {:>16} {:>16}'.format(
+        'case', 'detector', 'segments', 'hough ms', 'total ms', 'max error px', 'mean error px'))
+    failed = False
+    for name, (frames, truth) in cases.items():
+        frame_height = frames[0].shape[0]
+        top_y = frame_height * min(y for _, y in DEFAULT_CONFIG.roi)
+        for detector in detectors:
+            summary, lines = run(frames, PipelineConfig(detector=detector), args.frames)
+            if truth is None and detector == 'houghp':
+                truth = lines
+            errors = lane_line_errors(lines, truth, frame_height, top_y) * frame_height
+            over = name == 'test_images' and errors.max() > args.tolerance * frame_height
+            failed |= over
+            print('{:<16} {:<16} {:>10.0f} {:>10.2f} {:>10.2f} {:>16.1f} {:>16.1f}{}'.format(
+                name, detector, summary['segments']['mean'], summary['hough_ms']['p50'],
+                summary['total_ms']['p50'], errors.max(), errors.mean(), '  OVER TOLERANCE' if over else ''))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
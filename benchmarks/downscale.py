@@ -0,0 +1,79 @@
+"""
+Checks the speed and accuracy of the downscaled fast mode of the pipeline.
+
+For the test images and for synthetic frames at 1080p and 4K, runs
+find_lane_lines() at full resolution and downscaled by each factor that keeps
+the working frame at least `--min-height` pixels high. Reports the
+frames/sec, the speedup, and the largest distance between the end points of
+the lane lines and those found at full resolution, as a fraction of the frame
+height. Exits with status 1 when a distance is over `--tolerance`.
+
+    python benchmarks/downscale.py [--frames N] [--tolerance 0.05] [--min-height 270]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+
+from lanefind.config import PipelineConfig
+from lanefind.pipeline import find_lane_lines
+from lanefind.synthetic import RESOLUTIONS, synthetic_frame
+
+FACTORS = (0.5, 0.25, 0.125)
+
+
+def case_frames():
+    """Returns {case name: list of RGB frames}"""
+    image_dir = os.path.join(ROOT, 'test_images')
+    cases = {'test_images': [cv2.cvtColor(cv2.imread(os.path.join(image_dir, file_name)), cv2.COLOR_BGR2RGB)
+                             for file_name in sorted(os.listdir(image_dir))]}
+    for resolution in ('1080p', '4K'):
+        width, height = RESOLUTIONS[resolution]
+        cases[resolution] = [synthetic_frame(width, height, shift=0.01 * seed, seed=seed) for seed in range(3)]
+    return cases
+
+
+def time_lines(frames, config, frame_count):
+    """Returns the frames/sec of find_lane_lines() with `config`, and the lines of each of `frames`"""
+    lines = [find_lane_lines(frame, config=config) for frame in frames]
+    start = time.perf_counter()
+    for index in range(frame_count):
+        find_lane_lines(frames[index % len(frames)], config=config)
+    return frame_count / (time.perf_counter() - start), lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--frames', type=int, default=30, help='timed frames per run (default: %(default)s)')
+    parser.add_argument('--tolerance', type=float, default=0.05,
+                        help='largest end point distance, as a fraction of the height (default: %(default)s)')
+    parser.add_argument('--min-height', type=int, default=270,
+                        help='smallest downscaled frame height to try (default: %(default)s)')
+    args = parser.parse_args()
+
+    passed = True
+    for name, frames in case_frames().items():
+        height = frames[0].shape[0]
+        full_fps, full_lines = time_lines(frames, PipelineConfig(), args.frames)
+        print('{:<12} full resolution {:>5}p  {:>7.1f} frames/sec'.format(name, height, full_fps))
+        for factor in FACTORS:
+            if height * factor < args.min_height:
+                continue
+            fps, lines = time_lines(frames, PipelineConfig(downscale=factor), args.frames)
+            # a side that is only found at one of the resolutions counts as the full height off
+            distance = max(np.nan_to_num(np.abs(a - b), nan=height).max() for a, b in zip(lines, full_lines)) / height
+            over = distance > args.tolerance
+            passed &= not over
+            print('{:<12} downscale {:<5}  {:>5}p  {:>7.1f} frames/sec  {:>4.1f}x  max distance {:.3f}{}'.format(
+                name, factor, int(height * factor), fps, fps / full_fps, distance, '  OVER TOLERANCE' if over else ''))
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Compares the vectorized line fit of draw_lines() with the loop of draw_lines_iterative().
+
+Runs both on the HoughLinesP segments of the test images, with the
+parameters of the notebook, and prints how far apart the end points of their
+lines are. Then times both on synthetic Hough output with a growing number of
+segments. Exits with status 1 when an end point of the vectorized fit is more
+than --tolerance pixels from that of the loop. The loop extrapolates the longest
+segment of each side, the vectorized fit all of them weighted by their length,
+so on the test images the two are up to about 20 pixels apart.
+
+    python benchmarks/draw_lines.py [--tolerance 20] [--segments 10 100 1000 10000]
+"""
+import argparse
+import os
+import sys
+import timeit
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+
+from lanefind.pipeline import (canny, draw_lines, draw_lines_iterative, fit_lane_lines, fit_lane_lines_iterative,
+                               gaussian_blur, grayscale, left_right_lines, region_of_interest)
+
+
+def lane_segments(segment_count, imshape=(540, 960), seed=0):
+    """Returns `segment_count` random lane-like segments shaped like cv2.HoughLinesP() output"""
+    rng = np.random.RandomState(seed)
+    # half of the segments on a left lane line, half on a right lane line, with some noise
+    bottom_x = np.where(np.arange(segment_count) % 2 == 0, 150., 870.)
+    top_x = np.where(np.arange(segment_count) % 2 == 0, 460., 500.)
+    y1 = rng.uniform(330, imshape[0], segment_count)
+    y2 = np.clip(y1 - rng.uniform(40, 120, segment_count), 320, None)
+
+    def x_at(y):
+        return bottom_x + (top_x - bottom_x) * (imshape[0] - y) / (imshape[0] - 320) + rng.normal(0, 2, segment_count)
+    return np.stack([x_at(y1), y1, x_at(y2), y2], axis=1).astype(np.int32).reshape(-1, 1, 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tolerance', type=float, default=20.,
+                        help='largest end point distance allowed on the test images, in pixels (default: %(default)s)')
+    parser.add_argument('--segments', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                        help='segment counts to time (default: %(default)s)')
+    args = parser.parse_args()
+
+    image_dir = os.path.join(ROOT, 'test_images')
+    failed = False
+    for file_name in sorted(os.listdir(image_dir)):
+        image = cv2.cvtColor(cv2.imread(os.path.join(image_dir, file_name)), cv2.COLOR_BGR2RGB)
+        imshape = image.shape
+        vertices = np.array([[(145, imshape[0]), (445, 320), (540, 320), (imshape[1], imshape[0])]], dtype=np.int32)
+        masked_edges = region_of_interest(canny(gaussian_blur(grayscale(image), 5), 50, 150), vertices)
+        lines = cv2.HoughLinesP(masked_edges, 2, np.pi / 180, 15, np.array([]), minLineLength=40, maxLineGap=20)
+        # the end points as both draw them, truncated to pixels
+        vectorized = left_right_lines(fit_lane_lines(lines, imshape)).astype(int)
+        with warnings.catch_warnings():
+            # the loop divides by zero on vertical segments
+            warnings.simplefilter('ignore', RuntimeWarning)
+            iterative = left_right_lines(fit_lane_lines_iterative(lines, imshape)).astype(int)
+        difference = np.abs(vectorized - iterative).max()
+        over = not difference <= args.tolerance
+        failed |= over
+        print('{:<28} largest end point difference {:>6.1f} px{}'.format(
+            file_name, difference, '  OVER TOLERANCE' if over else ''))
+
+    line_img = np.zeros((540, 960, 3), dtype=np.uint8)
+    for segment_count in args.segments:
+        lines = lane_segments(segment_count)
+        runs = max(1, 10000 // segment_count)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            iterative_time = timeit.timeit(lambda: draw_lines_iterative(line_img, lines), number=runs) / runs
+        vectorized_time = timeit.timeit(lambda: draw_lines(line_img, lines), number=runs) / runs
+        print('{:>6} segments: iterative {:8.3f} ms, vectorized {:6.3f} ms, speedup {:6.1f}x'.format(
+            segment_count, iterative_time * 1e3, vectorized_time * 1e3, iterative_time / vectorized_time))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Times a small Canny and Hough parameter sweep with and without a FrameStore.
+
+Writes a synthetic road video, then runs every trial of the sweep on all of
+its frames in three ways: decoding the video again for each trial (with
+moviepy, as the notebook does, when it is installed, and with OpenCV),
+reading the frames from a FrameStore, and starting from the blurred frames
+cached in the store. Reports the seconds per trial of each, and checks that
+the store gives the same lane lines as decoding with OpenCV.
+
+    python benchmarks/framestore.py [--frames 150] [--resolution 720p]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+
+from lanefind.config import PipelineConfig
+from lanefind.framestore import FrameStore
+from lanefind.pipeline import find_lane_lines
+from lanefind.synthetic import RESOLUTIONS, write_synthetic_video
+from lanefind.video import read_video
+
+# the Canny thresholds and Hough parameters of each trial
+TRIALS = [PipelineConfig(low_threshold=low, high_threshold=3 * low, threshold=threshold / 540)
+          for low in (40, 50, 60) for threshold in (10, 15, 20)]
+
+
+def moviepy_frames(video):
+    from moviepy.video.io.VideoFileClip import VideoFileClip
+    clip = VideoFileClip(video)
+    try:
+        yield from clip.iter_frames()
+    finally:
+        clip.close()
+
+
+def opencv_frames(video):
+    for frame in read_video(video):
+        yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def sweep(lane_lines):
+    """Runs `lane_lines(config)`, which yields the lines of every frame, for every trial"""
+    start = time.perf_counter()
+    results = [np.array(list(lane_lines(config))) for config in TRIALS]
+    return (time.perf_counter() - start) / len(TRIALS), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--frames', type=int, default=150, help='frames of the video (default: %(default)s)')
+    parser.add_argument('--resolution', choices=RESOLUTIONS, default='720p', help='(default: %(default)s)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        video = os.path.join(directory, 'drive.mp4')
+        write_synthetic_video(video, args.frames, *RESOLUTIONS[args.resolution])
+        runs = []
+        try:
+            import moviepy
+            runs.append(('decode with moviepy', lambda config: (
+                find_lane_lines(frame, config=config) for frame in moviepy_frames(video))))
+        except ImportError:
+            print('moviepy is not installed, skipping it')
+        runs.append(('decode with OpenCV', lambda config: (
+            find_lane_lines(frame, config=config) for frame in opencv_frames(video))))
+
+        start = time.perf_counter()
+        store = FrameStore.create(video, os.path.join(directory, 'drive.frames'))
+        print('{:<28} {:>8.2f} s once'.format('create the store', time.perf_counter() - start))
+        runs.append(('frames from the store', lambda config: (
+            find_lane_lines(frame, config=config) for frame in store)))
+        start = time.perf_counter()
+        store.blurred_gray()
+        print('{:<28} {:>8.2f} s once'.format('cache the blurred frames', time.perf_counter() - start))
+        runs.append(('cached blurred frames', lambda config: store.lane_lines(config=config)))
+
+        baseline = None
+        results = {}
+        for name, lane_lines in runs:
+            seconds, results[name] = sweep(lane_lines)
+            baseline = baseline or seconds
+            print('{:<28} {:>8.2f} s per trial, {:>5.1f}x'.format(name, seconds, baseline / seconds))
+        for name in ('frames from the store', 'cached blurred frames'):
+            if not all(np.array_equal(a, b, equal_nan=True)
+                       for a, b in zip(results[name], results['decode with OpenCV'])):
+                sys.exit(name + ' gives other lane lines than decoding with OpenCV')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+Checks the lane lines of every optimized code path against golden lines.
+
+The golden lines are the left and right lane lines of the test images and of
+the frames of a synthetic drive, stored in benchmarks/golden.json: those
+find_lane_lines() gives on the full frame, and those of the crop to the
+region of interest and of the downscaled fast mode. `check` runs every path
+of the package, compares its lines with the golden ones it should give and
+times it: the buffer reusing FrameProcessor, the cached blurred frames of a
+FrameStore, the lane records and the worker processes of process_frames()
+against the full frame lines, and the crop and the downscaled frame against
+their own. Lines are compared by their horizontal distance at the bottom of
+the frame and at the top of the region of interest, in pixels, not by the
+pixels of the drawn frame. Exits with status 1 when the largest or the mean
+distance of a path is over its tolerance; a line missing on one side only is
+a frame height away.
+
+The goldens only catch changes. Two more references check that the lines
+are right, with tolerances made of two stated bounds (see PATHS): a line
+finder may be 5% of the frame height from a lane line, as in
+benchmarks/detectors.py, and on average a marking width, 10 px at 540p.
+
+- The synthetic drive is drawn with known lane lines, synthetic_lane_lines().
+  The lines of every path must stay within those bounds of them.
+- The crop, the downscaled frame and the `draw_lines_iterative` path, the
+  original loop fit of the notebook on the same Hough segments, are also
+  checked against the full frame goldens. Two lines each within 5% of the
+  frame height of a lane line are within 10% of each other, and on average
+  they must overlap by the marking width, or by twice that for the loop,
+  which follows one edge of a painted line where the fit takes the middle.
+
+The crop and the downscaled frame have goldens of their own: HoughLinesP
+rounds its votes relative to the corner of the image, so the same edges
+give other segments in a cropped or smaller image. At 540p their lines are
+up to 29 px (crop) and 13 px (downscale) from those of the full frame on
+the test images, 5 px and 3 px on average.
+
+    python benchmarks/golden.py check [--path NAME] [--output results.json]
+    python benchmarks/golden.py record     (after a change that is meant to move the lines)
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+
+from lanefind.config import DEFAULT_CONFIG, PipelineConfig
+from lanefind.pipeline import (blurred_gray, canny, find_lane_lines, fit_lane_lines_iterative, frame_geometry,
+                               hough_segments, lane_line_errors, left_right_lines, region_of_interest)
+from lanefind.synthetic import RESOLUTIONS, synthetic_frame, synthetic_lane_lines
+
+GOLDEN_FILE = os.path.join(ROOT, 'benchmarks', 'golden.json')
+# the known lines of a synthetic case, as a reference of a path
+KNOWN_LINES = 'known lines'
+
+
+def case_frames():
+    """Returns {case name: (list of RGB frames of the same shape, their known [left, right] lines or None)}"""
+    image_dir = os.path.join(ROOT, 'test_images')
+    cases = {'test_images': ([cv2.cvtColor(cv2.imread(os.path.join(image_dir, file_name)), cv2.COLOR_BGR2RGB)
+                              for file_name in sorted(os.listdir(image_dir))], None)}
+    # a drive with the lanes drifting sideways, made in memory so that it does not depend on the video codecs
+    width, height = RESOLUTIONS['720p']
+    shifts = 0.002 * np.arange(24)
+    cases['synthetic_drive'] = ([synthetic_frame(width, height, clutter=0, shift=shift, seed=index)
+                                 for index, shift in enumerate(shifts)],
+                                np.array([synthetic_lane_lines(width, height, shift) for shift in shifts]))
+    return cases
+
+
+def reference_lines(frames):
+    """The path of the golden lines"""
+    return [find_lane_lines(frame) for frame in frames]
+
+
+def processor_lines(frames):
+    from lanefind.processor import FrameProcessor
+    processor = FrameProcessor()
+    return [processor.find_lane_lines(frame) for frame in frames]
+
+
+def cropped_lines(frames):
+    return [find_lane_lines(frame, crop_to_roi=True) for frame in frames]
+
+
+def downscaled_lines(frames):
+    config = PipelineConfig(downscale=0.5)
+    return [find_lane_lines(frame, config=config) for frame in frames]
+
+
+def store_lines(frames):
+    from lanefind.framestore import FRAMES_FILE, INDEX_FILE, FrameStore, write_json
+    with tempfile.TemporaryDirectory() as directory:
+        # the frames as they are, a store made from a video would hold them decoded by its codec
+        np.array(frames).tofile(os.path.join(directory, FRAMES_FILE))
+        write_json(directory, INDEX_FILE, {'source': None, 'fps': 25., 'shape': [len(frames)] + list(frames[0].shape)})
+        store = FrameStore(directory)
+        lines = list(store.lane_lines())
+        del store
+    return lines
+
+
+def record_lines(frames):
+    from lanefind.records import record_frames
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'lanes.npy')
+        record_frames(frames, path)
+        records = np.load(path)
+    return [[[side[name] for name in ('x1', 'y1', 'x2', 'y2')] for side in (record['left'], record['right'])]
+            for record in records]
+
+
+def parallel_lines(frames):
+    from lanefind.video import process_frames
+    return list(process_frames(iter(frames), find_lane_lines, workers=2))
+
+
+def iterative_lines(frames):
+    """The original loop fit of draw_lines_iterative(), on the Hough segments of find_lane_lines()"""
+    lines = []
+    for frame in frames:
+        geometry = frame_geometry(frame.shape)
+        params = geometry.params
+        edges = region_of_interest(canny(blurred_gray(frame), params.low_threshold, params.high_threshold),
+                                   geometry.vertices)
+        segments = hough_segments(edges, params.rho, params.theta, params.threshold, params.min_line_length,
+                                  params.max_line_gap)
+        with warnings.catch_warnings():
+            # the loop divides by zero on vertical segments
+            warnings.simplefilter('ignore', RuntimeWarning)
+            lines.append(fit_lane_lines_iterative(segments, frame.shape))
+    return lines
+
+
+# {name: the path that records them}
+GOLDENS = {
+    'full_frame': reference_lines,
+    'crop_to_roi': cropped_lines,
+    'downscale_0.5': downscaled_lines,
+}
+
+# the bounds the tolerances are made of, in pixels of a 540 pixel high frame:
+# a line finder may be 5% of the frame height from the line it should find, the bound
+# benchmarks/detectors.py puts on the detectors against HoughLinesP
+LINE_BOUND = 0.05 * 540
+# and on average the width of a painted lane line, of the synthetic frames and of draw_lines()
+MARKING_WIDTH = 10.
+
+# the path gives the lines it was recorded from
+SAME = (0.5, 0.5)
+# the path finds the lane lines the frame was drawn with
+RIGHT = (LINE_BOUND, MARKING_WIDTH)
+
+# {name: (lane lines of a list of frames,
+#         {golden lines or KNOWN_LINES: largest and mean distance allowed from them})}
+PATHS = {
+    'pipeline': (reference_lines, {'full_frame': SAME, KNOWN_LINES: RIGHT}),
+    'frame_processor': (processor_lines, {'full_frame': SAME, KNOWN_LINES: RIGHT}),
+    # the crop and the downscaled frame give other Hough segments than the full frame, see the module docstring.
+    # Two line finders that are each within LINE_BOUND of a lane line are within twice that of each other, and
+    # on average the lines they draw must still overlap
+    'crop_to_roi': (cropped_lines, {'crop_to_roi': SAME, 'full_frame': (2 * LINE_BOUND, MARKING_WIDTH),
+                                    KNOWN_LINES: RIGHT}),
+    'downscale_0.5': (downscaled_lines, {'downscale_0.5': SAME, 'full_frame': (2 * LINE_BOUND, MARKING_WIDTH),
+                                         KNOWN_LINES: RIGHT}),
+    'framestore': (store_lines, {'full_frame': SAME, KNOWN_LINES: RIGHT}),
+    'records': (record_lines, {'full_frame': SAME, KNOWN_LINES: RIGHT}),
+    'process_frames': (parallel_lines, {'full_frame': SAME, KNOWN_LINES: RIGHT}),
+    # Canny finds both edges of a painted line, a marking width apart. The loop follows the longest segment,
+    # on one of them, where the fit averages all segments towards the middle: a marking width more on average
+    'draw_lines_iterative': (iterative_lines, {'full_frame': (2 * LINE_BOUND, 2 * MARKING_WIDTH),
+                                               KNOWN_LINES: (LINE_BOUND, 2 * MARKING_WIDTH)}),
+}
+
+
+def golden_json(lines):
+    """Returns the [left, right] lines of each frame, a missing line as None"""
+    return [[None if np.isnan(line).any() else [round(float(value), 2) for value in line]
+             for line in left_right_lines(np.asarray(two_lines, dtype=float))]
+            for two_lines in lines]
+
+
+def from_golden_json(frames):
+    return np.array([[[np.nan] * 4 if line is None else line for line in lines] for lines in frames], dtype=float)
+
+
+def record(args):
+    cases = case_frames()
+    golden = {
+        'opencv': cv2.__version__,
+        'goldens': {name: {case: golden_json(lane_lines(frames)) for case, (frames, _) in cases.items()}
+                    for name, lane_lines in GOLDENS.items()},
+    }
+    with open(GOLDEN_FILE, 'w') as output:
+        json.dump(golden, output, indent=1)
+    print('{}: {} frames'.format(GOLDEN_FILE, sum(len(frames) for frames, _ in cases.values())))
+
+
+def line_errors(lines, reference, height):
+    """Returns the distances of `lines` from `reference` in pixels, 0 for a line missing from both"""
+    top_y = height * min(y for _, y in DEFAULT_CONFIG.roi)
+    found, reference_found = ~np.isnan(lines).any(axis=2), ~np.isnan(reference).any(axis=2)
+    # two missing lines agree, lane_line_errors() counts them as 1 apart
+    return np.where(found | reference_found, lane_line_errors(lines, reference, height, top_y), 0.) * height
+
+
+def compare(path, case, reference, errors, tolerances, ms, results):
+    """Prints and appends to `results` how far the lines of a path are from a reference, returns whether it passed"""
+    max_tolerance, mean_tolerance = tolerances
+    ok = errors.max() <= max_tolerance and errors.mean() <= mean_tolerance
+    results.append({'path': path, 'case': case, 'reference': reference, 'ms_per_frame': ms,
+                    'max_error_px': errors.max(), 'max_tolerance_px': max_tolerance,
+                    'mean_error_px': errors.mean(), 'mean_tolerance_px': mean_tolerance, 'passed': bool(ok)})
+    print('{:<20} {:<16} {:<14} {:>8.2f} ms/frame  max error {:>6.2f} px of {:>5.2f}, mean {:>5.2f} of {:>5.2f}  {}'
+          .format(path, case, reference, ms, errors.max(), max_tolerance, errors.mean(), mean_tolerance,
+                  'ok' if ok else 'FAILED'))
+    return ok
+
+
+def check(args):
+    with open(GOLDEN_FILE) as golden_file:
+        golden = json.load(golden_file)
+    if golden['opencv'] != cv2.__version__:
+        print('the golden lines were recorded with OpenCV {}, this is {}'.format(golden['opencv'], cv2.__version__))
+    cases = case_frames()
+    results = []
+    passed = True
+    for path in args.path or PATHS:
+        lane_lines, references = PATHS[path]
+        for name, (frames, truth) in cases.items():
+            height = frames[0].shape[0]
+            # the tolerances are in pixels of a 540 pixel high frame
+            scale = height / 540
+            start = time.perf_counter()
+            lines = from_golden_json(golden_json(lane_lines(frames)))
+            ms = (time.perf_counter() - start) / len(frames) * 1e3
+            for reference, tolerance in references.items():
+                if reference == KNOWN_LINES and truth is None:
+                    continue
+                expected = truth if reference == KNOWN_LINES else from_golden_json(golden['goldens'][reference][name])
+                errors = line_errors(lines, expected, height)
+                passed &= compare(path, name, reference, errors, [t * scale for t in tolerance], ms, results)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=1)
+    if not passed:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    check_parser = commands.add_parser('check', help='check and time every path against the golden lines')
+    check_parser.add_argument('--path', action='append', choices=PATHS, help='only check this path, can be repeated')
+    check_parser.add_argument('--output', help='JSON file to write the results to')
+    check_parser.set_defaults(run=check)
+    record_parser = commands.add_parser('record', help='record the golden lines with find_lane_lines()')
+    record_parser.set_defaults(run=record)
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Benchmarks process_image() and its stages.
+
+Runs the pipeline over the test images and over synthetic frames at 540p,
+720p, 1080p and 4K with several densities of road clutter (more clutter,
+more Hough segments), and reports the frames/sec, the p50/p95 latency of
+every stage, the edge pixels and Hough segments per frame and the peak RSS
+of each case.
+Every case runs in a fresh process, so that its peak RSS is its own.
+Needs neither the test videos nor a GPU.
+
+    python benchmarks/pipeline.py run [--frames N] [--output results.json] [--baseline old.json]
+    python benchmarks/pipeline.py compare old.json new.json [--threshold 0.1]
+
+`compare`, and `run` with a `--baseline`, exit with status 1 when the
+frames/sec of a case dropped by more than `threshold` (10% by default).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CLUTTER = {'clean': 0, 'cluttered': 100, 'busy': 400}
+
+
+def cases():
+    """Returns the names of all benchmark cases"""
+    from lanefind.synthetic import RESOLUTIONS
+    return ['test_images'] + ['{}-{}'.format(resolution, density)
+                              for resolution in RESOLUTIONS for density in CLUTTER]
+
+
+def case_frames(name):
+    """Returns the RGB frames of the case `name`"""
+    import cv2
+    from lanefind.synthetic import RESOLUTIONS, synthetic_frame
+    if name == 'test_images':
+        image_dir = os.path.join(ROOT, 'test_images')
+        return [cv2.cvtColor(cv2.imread(os.path.join(image_dir, file_name)), cv2.COLOR_BGR2RGB)
+                for file_name in sorted(os.listdir(image_dir))]
+    resolution, density = name.split('-')
+    width, height = RESOLUTIONS[resolution]
+    # a few different frames, so the run is not dominated by one lucky layout
+    return [synthetic_frame(width, height, CLUTTER[density], shift=0.01 * seed, seed=seed) for seed in range(3)]
+
+
+def run_case(name, frame_count, warmup=3):
+    """Runs `frame_count` frames of the case `name` and returns its results"""
+    from lanefind import profiling
+    from lanefind.pipeline import process_image
+    frames = case_frames(name)
+    for index in range(warmup):
+        process_image(frames[index % len(frames)])
+
+    profiler = profiling.enable()
+    start = time.perf_counter()
+    for index in range(frame_count):
+        process_image(frames[index % len(frames)])
+    elapsed = time.perf_counter() - start
+    profiling.disable()
+
+    summary = profiler.summary()
+    return {
+        'frames': frame_count,
+        'resolution': '{}x{}'.format(frames[0].shape[1], frames[0].shape[0]),
+        'fps': frame_count / elapsed,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.,
+        'segments': summary['segments']['p50'],
+        'edge_pixels': summary['edge_pixels']['p50'],
+        # the other columns are counters, not stages
+        'stages_ms': {column[:-len('_ms')]: {'p50': stats['p50'], 'p95': stats['p95']}
+                      for column, stats in summary.items() if column.endswith('_ms')},
+    }
+
+
+def run(frame_count, names=None):
+    """Runs the cases `names`, all by default, each in a fresh process"""
+    import cv2
+    import numpy as np
+    results = {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': multiprocessing.cpu_count(),
+        },
+        'cases': {},
+    }
+    context = multiprocessing.get_context('spawn')
+    for name in names or cases():
+        with context.Pool(1) as pool:
+            result = pool.apply(run_case, (name, frame_count))
+        results['cases'][name] = result
+        print('{:<20} {:>10} {:>8.1f} frames/sec  total p50 {:>7.2f} ms  {:>8.0f} edge pixels  {:>6.0f} segments'
+              '  peak RSS {:>6.0f} MB'.format(
+                  name, result['resolution'], result['fps'], result['stages_ms']['total']['p50'],
+                  result['edge_pixels'], result['segments'], result['peak_rss_mb']))
+    return results
+
+
+def compare(baseline, results, threshold):
+    """Prints the changes from `baseline` to `results`, returns True when no case regressed by more than `threshold`"""
+    passed = True
+    for name, result in results['cases'].items():
+        if name not in baseline['cases']:
+            continue
+        old = baseline['cases'][name]
+        change = result['fps'] / old['fps'] - 1
+        regressed = change < -threshold
+        passed &= not regressed
+        slower_stages = ['{} {:+.0%}'.format(stage, stats['p50'] / old['stages_ms'][stage]['p50'] - 1)
+                         for stage, stats in result['stages_ms'].items()
+                         if stage in old['stages_ms'] and stats['p50'] > (1 + threshold) * old['stages_ms'][stage]['p50']]
+        print('{:<20} {:>8.1f} -> {:>8.1f} frames/sec ({:+.1%}){}{}'.format(
+            name, old['fps'], result['fps'], change, '  REGRESSION' if regressed else '',
+            '  slower: ' + ', '.join(slower_stages) if slower_stages else ''))
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--frames', type=int, default=30, help='frames per case (default: %(default)s)')
+    run_parser.add_argument('--case', action='append', choices=cases(), help='only run this case, can be repeated')
+    run_parser.add_argument('--output', help='JSON file to write the results to')
+    run_parser.add_argument('--baseline', help='JSON results to compare with')
+    run_parser.add_argument('--threshold', type=float, default=0.1, help='allowed frames/sec drop (default: %(default)s)')
+    compare_parser = commands.add_parser('compare', help='compare two JSON results')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('results')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='allowed frames/sec drop (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.baseline) as baseline, open(args.results) as results:
+            sys.exit(0 if compare(json.load(baseline), json.load(results), args.threshold) else 1)
+
+    results = run(args.frames, args.case)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=1)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            sys.exit(0 if compare(json.load(baseline), results, args.threshold) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Compares writing lane records with drawing the lane lines on a video.
+
+Writes a synthetic road video with OpenCV, then runs process_video(), which
+draws the lines on every frame and encodes the result with moviepy, and
+record_video(), which writes the lane lines of every frame to a .jsonl and
+to a .npy file without drawing or encoding anything, also with the region
+of interest crop and the downscaled fast mode. Reports the frames/sec of
+each and the speedup. Needs moviepy for process_video().
+
+    python benchmarks/records.py [--frames 300] [--resolution 720p]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lanefind.config import PipelineConfig
+from lanefind.records import record_video
+from lanefind.synthetic import RESOLUTIONS, write_synthetic_video
+from lanefind.video import process_video
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--frames', type=int, default=300, help='frames of the video (default: %(default)s)')
+    parser.add_argument('--resolution', choices=RESOLUTIONS, default='720p', help='(default: %(default)s)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        video = os.path.join(directory, 'drive.mp4')
+        write_synthetic_video(video, args.frames, *RESOLUTIONS[args.resolution])
+        rendered_fps = process_video(video, os.path.join(directory, 'drive_marked.mp4'))
+        runs = [('drive.jsonl', False, None), ('drive.npy', False, None),
+                ('drive.npy, crop to ROI, downscale 0.5', True, PipelineConfig(downscale=0.5))]
+        for name, crop_to_roi, config in runs:
+            fps = record_video(video, os.path.join(directory, name.split(',')[0]), crop_to_roi, config)
+            print('{:<40} {:>7.1f} frames/sec, {:.1f}x the frames/sec of process_video()'.format(
+                name, fps, fps / rendered_fps))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Load test of the lane finding service.
+
+Starts `lanefind serve` on a free port (or uses the one at `--url`), then
+posts the test images as JPEGs from a growing number of concurrent clients,
+each on its own keep-alive connection. Reports, for every concurrency, the
+answered requests/sec, the p50/p95/p99 latency, the requests rejected with a
+503, the mean micro-batch size and the most workers busy at once from
+/metrics. With several --workers counts, a service is started for each, to
+show how requests/sec scale with the workers (up to the cores).
+
+    python benchmarks/service_load.py [--concurrency 1 2 4 8 16 32] [--duration 5] [--workers 1 2 4]
+                                      [--url http://127.0.0.1:8080]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lanefind.profiling import percentile_summary
+
+
+async def request(reader, writer, method, path, body=b'', content_type='image/jpeg'):
+    """Sends a request on a keep-alive connection and returns the (status, JSON body)"""
+    writer.write('{} {} HTTP/1.1\r\nHost: localhost\r\nContent-Type: {}\r\nContent-Length: {}\r\n\r\n'.format(
+        method, path, content_type, len(body)).encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def client(host, port, bodies, stop_time, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    index = 0
+    try:
+        while time.perf_counter() < stop_time:
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, 'POST', '/lanes', bodies[index % len(bodies)])
+            statuses.append(status)
+            index += 1
+            if status == 200:
+                latencies.append((time.perf_counter() - start) * 1e3)
+            elif status == 503:
+                # back off as the service asks
+                await asyncio.sleep(0.05)
+    finally:
+        writer.close()
+
+
+async def metrics(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        return (await request(reader, writer, 'GET', '/metrics'))[1]
+    finally:
+        writer.close()
+
+
+async def run_level(host, port, bodies, concurrency, duration):
+    """Runs `concurrency` clients for `duration` seconds and returns the results"""
+    before = await metrics(host, port)
+    latencies, statuses = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*[client(host, port, bodies, start + duration, latencies, statuses)
+                           for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    after = await metrics(host, port)
+    batches = after['batches'] - before['batches']
+    return {
+        'concurrency': concurrency,
+        'requests_per_sec': len(latencies) / elapsed,
+        'latency_ms': percentile_summary(latencies),
+        'rejected': statuses.count(503),
+        'errors': len(statuses) - len(latencies) - statuses.count(503),
+        'mean_batch_size': (after['batched_requests'] - before['batched_requests']) / batches if batches else 0.,
+        'max_busy_workers': after['max_busy_workers'],
+    }
+
+
+def start_service(args):
+    """Starts `lanefind serve` on a free port, returns the process and its (host, port)"""
+    command = [sys.executable, '-m', 'lanefind', 'serve', '--port', '0'] + args
+    service = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, universal_newlines=True)
+    line = service.stdout.readline()
+    if not line.startswith('lanefind: serving on '):
+        service.kill()
+        sys.exit('the service did not start: ' + line)
+    url = urllib.parse.urlsplit(line.split()[-1])
+    return service, (url.hostname, url.port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                        help='concurrent clients of each run (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=5., help='seconds per run (default: %(default)s)')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        help='worker threads of the started service, one service per count (default: one per core)')
+    parser.add_argument('--url', help='an already running service, instead of starting one')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    args, service_args = parser.parse_known_args()
+
+    import cv2
+    image_dir = os.path.join(ROOT, 'test_images')
+    bodies = [cv2.imencode('.jpg', cv2.imread(os.path.join(image_dir, file_name)))[1].tobytes()
+              for file_name in sorted(os.listdir(image_dir))]
+
+    results = []
+    for workers in args.workers or [None]:
+        service = None
+        if args.url:
+            url = urllib.parse.urlsplit(args.url)
+            address = url.hostname, url.port
+        else:
+            # any other arguments go to `lanefind serve`, e.g. --max-batch 16
+            service, address = start_service(service_args + (['--workers', str(workers)] if workers else []))
+        try:
+            for concurrency in args.concurrency:
+                result = asyncio.run(run_level(*address, bodies, concurrency, args.duration))
+                result['workers'] = workers
+                results.append(result)
+                print('{:>4} workers {:>4} clients  {:>7.1f} requests/sec  p50 {:>7.2f} ms  p95 {:>7.2f} ms  '
+                      'p99 {:>7.2f} ms  {:>5} rejected  batch {:.1f}  busy workers {}'.format(
+                          workers or 'all', concurrency, result['requests_per_sec'], result['latency_ms']['p50'],
+                          result['latency_ms']['p95'], result['latency_ms']['p99'], result['rejected'],
+                          result['mean_batch_size'], result['max_busy_workers']))
+        finally:
+            if service is not None:
+                service.terminate()
+                service.wait()
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Measures the import time of lanefind and the cold start of its command line.
+
+Every measurement starts a fresh interpreter and takes the median of a few
+runs, minus the startup time of a bare interpreter. Exits with status 1 when
+a measurement is over its budget, or when a heavy dependency (matplotlib,
+moviepy, IPython) is loaded without being needed.
+
+    python benchmarks/startup.py [--runs N]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# milliseconds on top of a bare interpreter, see the README
+BUDGETS = [
+    ('import lanefind', ['-c', 'import lanefind'], 30),
+    ('lanefind --help', ['-m', 'lanefind', '--help'], 80),
+    ('import the pipeline', ['-c', 'import lanefind; lanefind.process_image'], 400),
+]
+
+HEAVY_MODULES = ('matplotlib', 'moviepy', 'IPython')
+
+
+def run_time(args, runs):
+    """Returns the median wall time in seconds of `python args` over `runs` runs"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def loaded_heavy_modules():
+    """Returns the heavy modules loaded after importing all of lanefind's names"""
+    code = ('import sys, lanefind\n'
+            'for name in lanefind.__all__: getattr(lanefind, name)\n'
+            'print(" ".join(m for m in {!r} if m in sys.modules))'.format(HEAVY_MODULES))
+    return subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                          stdout=subprocess.PIPE, universal_newlines=True).stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=7)
+    args = parser.parse_args()
+
+    interpreter = run_time(['-c', 'pass'], args.runs)
+    print('bare interpreter: {:.0f} ms'.format(interpreter * 1e3))
+    failed = False
+    for name, command, budget in BUDGETS:
+        elapsed = (run_time(command, args.runs) - interpreter) * 1e3
+        over = elapsed > budget
+        failed |= over
+        print('{}: {:.0f} ms (budget {} ms){}'.format(name, elapsed, budget, ' OVER BUDGET' if over else ''))
+    heavy = loaded_heavy_modules()
+    if heavy:
+        failed = True
+        print('heavy modules loaded on import:', ', '.join(heavy))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Measures the latency of `lanefind stream` on a raw frame pipe.
+
+Starts `lanefind stream -` and writes synthetic frames to its stdin at each
+frame rate, as a camera would, without waiting for the pipeline. Reports the
+frames read, processed and dropped, and the p50/p95/p99 of the time from
+reading a frame to its lane lines, and of the pipeline alone. Above the frame
+rate the pipeline keeps up with, frames are dropped but the latency stays
+bounded: the newest frame waits at most for the frame in progress. Exits
+with status 1 when the p95 latency is over twice the p95 time of the pipeline.
+
+    python benchmarks/stream.py [--fps 10 30 60 120] [--frames 150] [--resolution 720p]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lanefind.synthetic import RESOLUTIONS, write_synthetic_stream
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--fps', type=float, nargs='+', default=[10, 30, 60, 120],
+                        help='frame rates to write the frames at (default: %(default)s)')
+    parser.add_argument('--frames', type=int, default=150, help='frames per run (default: %(default)s)')
+    parser.add_argument('--resolution', choices=RESOLUTIONS, default='720p', help='(default: %(default)s)')
+    parser.add_argument('--clutter', type=int, default=30, help='road clutter strokes (default: %(default)s)')
+    args = parser.parse_args()
+    width, height = RESOLUTIONS[args.resolution]
+
+    print('{:>8} {:>8} {:>10} {:>8}  {:>26}  {:>26}'.format(
+        'fps', 'read', 'processed', 'dropped', 'latency ms p50/p95/p99', 'pipeline ms p50/p95/p99'))
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        stats_path = os.path.join(directory, 'stats.json')
+        for fps in args.fps:
+            stream = subprocess.Popen(
+                [sys.executable, '-m', 'lanefind', 'stream', '-', '--width', str(width), '--height', str(height),
+                 '--lanes', os.path.join(directory, 'lanes.jsonl'), '--stats', stats_path],
+                stdin=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=ROOT)
+            try:
+                write_synthetic_stream(stream.stdin, args.frames, width, height, fps, args.clutter)
+            finally:
+                stream.stdin.close()
+                stream.wait()
+            with open(stats_path) as stats_file:
+                stats = json.load(stats_file)
+            latency, pipeline = stats['latency_ms'], stats['process_ms']
+            over = latency['p95'] > 2 * pipeline['p95']
+            failed |= over
+            print('{:>8.0f} {:>8} {:>10} {:>8}  {:>26}  {:>26}{}'.format(
+                fps, stats['read'], stats['processed'], stats['dropped'],
+                '{p50:.1f} / {p95:.1f} / {p99:.1f}'.format(**latency),
+                '{p50:.1f} / {p95:.1f} / {p99:.1f}'.format(**pipeline), '  OVER' if over else ''))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Finding lane lines on the road.
+
+The lane finding pipeline of the P1 notebook as an importable package.
+The submodules, and with them OpenCV and NumPy, are only imported once one
+of their names is used, so that `import lanefind` and the `lanefind`
+command line start quickly.
+"""
+import importlib
+
+_exports = {
+    'grayscale': 'lanefind.pipeline',
+    'lane_color_mask': 'lanefind.pipeline',
+    'canny': 'lanefind.pipeline',
+    'gaussian_blur': 'lanefind.pipeline',
+    'roi_mask': 'lanefind.pipeline',
+    'region_of_interest': 'lanefind.pipeline',
+    'roi_bounding_box': 'lanefind.pipeline',
+    'fit_lane_lines': 'lanefind.pipeline',
+    'draw_lines': 'lanefind.pipeline',
+    'draw_lines_iterative': 'lanefind.pipeline',
+    'fit_lane_lines_iterative': 'lanefind.pipeline',
+    'hough_lines': 'lanefind.pipeline',
+    'weighted_img': 'lanefind.pipeline',
+    'draw_lane_lines': 'lanefind.pipeline',
+    'hough_segments': 'lanefind.pipeline',
+    'find_lane_lines': 'lanefind.pipeline',
+    'frame_geometry': 'lanefind.pipeline',
+    'blurred_gray': 'lanefind.pipeline',
+    'find_lane_lines_in_blur': 'lanefind.pipeline',
+    'process_image': 'lanefind.pipeline',
+    'PipelineConfig': 'lanefind.config',
+    'FrameProcessor': 'lanefind.processor',
+    'LaneTracker': 'lanefind.tracker',
+    'AdaptiveLaneFinder': 'lanefind.adaptive',
+    'process_frames': 'lanefind.video',
+    'process_video': 'lanefind.video',
+    'process_image_file': 'lanefind.batch',
+    'process_directory': 'lanefind.batch',
+    'LaneService': 'lanefind.service',
+    'FrameStore': 'lanefind.framestore',
+    'run_sweep': 'lanefind.sweep',
+    'LaneRecordWriter': 'lanefind.records',
+    'record_frames': 'lanefind.records',
+    'record_video': 'lanefind.records',
+    'LatestFrameStream': 'lanefind.stream',
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(importlib.import_module(_exports[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
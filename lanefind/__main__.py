@@ -0,0 +1,3 @@
+from lanefind.cli import main
+
+main()
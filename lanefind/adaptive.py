@@ -0,0 +1,163 @@
+"""
+Adaptive frame skipping: full lane detection on some frames of a video, and
+the lines of the others reused from them.
+
+    lanefind video drive.mp4 out.mp4 --adaptive 0.02
+    lanefind lanes drive.mp4 drive.npy --adaptive 0.02
+
+AdaptiveLaneFinder runs the pipeline every `interval` frames. In between it
+extrapolates the last detected lines with their motion between the last two
+detections, or, for lane records, interpolates them between the detections
+before and after. On every detection it compares the lines it finds with the
+ones it would have extrapolated: if they are further apart than the accuracy
+`budget`, as a fraction of the frame height, the interval drops back to
+`min_interval`, and if they are within half of it, the interval grows by a
+frame. So the pipeline runs on every frame through sharp curves and lane
+changes, or after a detection that jumped, and on one in `max_interval` on a
+straight, steady road.
+"""
+import time
+
+import numpy as np
+
+from lanefind import profiling
+from lanefind.pipeline import lane_line_errors, left_right_order
+from lanefind.processor import FrameProcessor
+
+
+class AdaptiveLaneFinder:
+    """
+    Finds the lane lines of the frames of a video, skipping the detection on
+    frames whose lines it can predict within `budget` of the frame height.
+
+    The interval between detections stays between `min_interval` and
+    `max_interval` frames. `crop_to_roi`, `config` and `bgr` are those of the
+    FrameProcessor that runs the detection. The lines are [left, right] rows.
+
+    The frames must arrive in order: use clip.fl_image(finder.process_image),
+    or process_video() with workers=1.
+    """
+
+    def __init__(self, budget=0.02, min_interval=1, max_interval=10, crop_to_roi=False, config=None, bgr=False):
+        self.budget = budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.processor = FrameProcessor(crop_to_roi, config, bgr=bgr)
+        self.reset()
+
+    def reset(self):
+        """Forgets the detected lines and the counts, e.g. before starting on another video"""
+        self.interval = self.min_interval
+        self.frames = 0
+        self.detections = 0
+        # the lines of the last detection, their motion per frame and where it was
+        self.lines = np.full((2, 4), np.nan)
+        self.velocity = np.zeros((2, 4))
+        self.detected_at = None
+        self.counts = np.zeros(2, dtype=int)
+        self.coverage = np.zeros(2)
+        # the seconds spent in find_lane_lines(), and in its detections
+        self.seconds = 0.
+        self.detection_seconds = 0.
+
+    @property
+    def detection_rate(self):
+        """The fraction of the frames so far that ran the full detection"""
+        return self.detections / self.frames if self.frames else 0.
+
+    @property
+    def speedup(self):
+        """
+        How many times faster the lane lines of the frames so far were found
+        than by detecting them on every frame, estimated from the mean time of
+        a detection
+        """
+        if not self.detections or not self.seconds:
+            return 1.
+        return self.detection_seconds / self.detections * self.frames / self.seconds
+
+    def detection_summary(self):
+        return 'detection on {} frames ({:.0%}), lane finding {:.1f}x faster than on every frame'.format(
+            self.detections, self.detection_rate, self.speedup)
+
+    def due(self, index):
+        """Whether frame `index` runs the detection"""
+        return self.detected_at is None or index - self.detected_at >= self.interval
+
+    def predict(self, index):
+        """Returns the lines of frame `index` extrapolated from the last detection"""
+        return self.lines + self.velocity * (index - self.detected_at)
+
+    def update(self, index, lines, height):
+        """Adapts the interval to how far the detected `lines` of frame `index` are from the prediction"""
+        if self.detected_at is not None:
+            top_y = height * min(y for _, y in self.processor.config.roi)
+            error = lane_line_errors(lines, self.predict(index), height, top_y).max()
+            if error > self.budget:
+                # a lane change, or a bad detection: check the next frames
+                self.interval = self.min_interval
+            elif error <= self.budget / 2:
+                self.interval = min(self.max_interval, self.interval + 1)
+            # a side missing from either detection does not move
+            self.velocity = np.nan_to_num((lines - self.lines) / (index - self.detected_at), nan=0.)
+        self.lines = lines
+        self.detected_at = index
+
+    def find_lane_lines(self, image, return_support=False):
+        """
+        Returns the [left, right] lane lines of the next frame, detected or
+        extrapolated. With `return_support` also the segment counts, 0 on a
+        skipped frame, and the coverage of the last detection, like
+        fit_lane_lines(..., return_support=True).
+        """
+        with profiling.frame():
+            start = time.perf_counter()
+            index = self.frames
+            self.frames += 1
+            if self.due(index):
+                two_lines, counts, coverage = self.processor.find_lane_lines(image, return_support=True)
+                order = left_right_order(two_lines)
+                self.update(index, two_lines[order], image.shape[0])
+                self.counts, self.coverage = counts[order], coverage[order]
+                self.detections += 1
+                profiling.count('detections', 1)
+                lines, counts = self.lines, self.counts
+                self.detection_seconds += time.perf_counter() - start
+            else:
+                lines, counts = self.predict(index), np.zeros(2, dtype=int)
+            self.seconds += time.perf_counter() - start
+            return (lines, counts, self.coverage) if return_support else lines
+
+    def lane_lines(self, frames, return_support=False):
+        """
+        Yields the lane lines of every frame of `frames`, like find_lane_lines(),
+        but the lines of a skipped frame are interpolated between the detections
+        before and after it, so they lag the video by up to `max_interval` frames.
+        A side missing from the later detection keeps the earlier line.
+        """
+        # the indexes of the frames since the last detection
+        skipped = []
+        for frame in frames:
+            lines, coverage, detected_at = self.lines, self.coverage, self.detected_at
+            if not self.due(self.frames):
+                skipped.append(self.frames)
+                self.frames += 1
+                continue
+            result = self.find_lane_lines(frame, return_support=True)
+            for index in skipped:
+                between = lines + (self.lines - lines) * (index - detected_at) / (self.frames - 1 - detected_at)
+                between = np.where(np.isnan(between), lines, between)
+                yield (between, np.zeros(2, dtype=int), coverage) if return_support else between
+            skipped = []
+            yield result if return_support else result[0]
+        for index in skipped:
+            lines = self.predict(index)
+            yield (lines, np.zeros(2, dtype=int), self.coverage) if return_support else lines
+
+    def process_image(self, image, out=None):
+        """
+        Returns `image` with the lane lines of find_lane_lines() drawn on it,
+        see FrameProcessor.process_image() for `out`.
+        """
+        with profiling.frame():
+            return self.processor.draw_lane_lines(image, self.find_lane_lines(image), out)
@@ -0,0 +1,90 @@
+"""Processing directories of images on a pool of worker processes."""
+import functools
+import multiprocessing
+import os
+import sys
+import threading
+
+import cv2
+
+from lanefind.pipeline import process_image
+
+# the prefix of the temporary file an output is written to before it is renamed
+PARTIAL_PREFIX = '.partial-'
+
+
+def process_image_file(files, frame_function=process_image):
+    """Reads the image file of the `files` pair, runs `frame_function` on it and saves the result to the output file"""
+    image_file, output_file = files
+    image = cv2.imread(image_file, cv2.IMREAD_COLOR)
+    if image is None:
+        raise IOError('cannot read image file ' + image_file)
+    # the pipeline works on RGB images, like the ones from matplotlib and moviepy
+    result = frame_function(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    # write to a temporary file first, so an interrupted run never leaves a partial output behind
+    partial_file = os.path.join(os.path.dirname(output_file), PARTIAL_PREFIX + os.path.basename(output_file))
+    if not cv2.imwrite(partial_file, cv2.cvtColor(result, cv2.COLOR_RGB2BGR)):
+        raise IOError('cannot write image file ' + partial_file)
+    os.replace(partial_file, output_file)
+    return output_file
+
+def try_process_image_file(files, frame_function=process_image):
+    """
+    Runs process_image_file() on the `files` pair. Returns the image file, and
+    the output file or None and the error message when the image cannot be
+    read, decoded or written.
+    """
+    try:
+        return files[0], process_image_file(files, frame_function), None
+    except (OSError, cv2.error) as error:
+        return files[0], None, str(error).strip()
+
+def process_directory(input_dir, output_dir, frame_function=process_image, workers=None, suffix="line_marked.jpg",
+                      errors=None):
+    """
+    Runs `frame_function` on every image of `input_dir` on a pool of `workers` processes.
+
+    The result for `file_name` is saved as `file_name + suffix` in `output_dir`.
+    Files are handed to the pool one at a time, with at most 4 per worker in
+    flight, so memory use does not grow with the size of the directory. Images
+    whose output already exists are skipped, so an interrupted run can simply be
+    started again. Yields the written files in the order they are finished.
+    Files ending in `suffix` and the temporary files of an interrupted run are
+    not images to process, so `output_dir` can be `input_dir`.
+
+    An image that cannot be read, decoded or written does not stop the run: it
+    is skipped, and its (image file, error message) is appended to the list
+    `errors`, or printed to stderr without one.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    os.makedirs(output_dir, exist_ok=True)
+    slots = threading.Semaphore(4 * workers)
+    stopped = threading.Event()
+
+    def tasks():
+        with os.scandir(input_dir) as entries:
+            for entry in entries:
+                output_file = os.path.join(output_dir, entry.name + suffix)
+                if not entry.is_file() or not entry.name.lower().endswith(('.jpg', '.jpeg', '.png')) \
+                        or entry.name.endswith(suffix) or entry.name.startswith(PARTIAL_PREFIX) \
+                        or os.path.exists(output_file):
+                    continue
+                slots.acquire()
+                if stopped.is_set():
+                    return
+                yield entry.path, output_file
+
+    with multiprocessing.Pool(workers) as pool:
+        try:
+            for image_file, output_file, error in pool.imap_unordered(
+                    functools.partial(try_process_image_file, frame_function=frame_function), tasks()):
+                slots.release()
+                if error is None:
+                    yield output_file
+                elif errors is not None:
+                    errors.append((image_file, error))
+                else:
+                    print('skipped {}: {}'.format(image_file, error), file=sys.stderr)
+        finally:
+            stopped.set()
+            slots.release()
@@ -0,0 +1,298 @@
+"""
+The `lanefind` command line.
+
+    lanefind image INPUT OUTPUT [--profile FILE]
+    lanefind video INPUT OUTPUT [--workers N] [--queue-depth N] [--track] [--adaptive BUDGET] [--profile FILE]
+    lanefind dir INPUT_DIR OUTPUT_DIR [--workers N] [--suffix SUFFIX]
+    lanefind lanes INPUT OUTPUT.jsonl|OUTPUT.npy [--adaptive BUDGET] [--profile FILE]
+    lanefind store INPUT STORE_DIR [--max-frames N]
+    lanefind sweep INPUT [--space FILE] [--random N] [--workers N] [--output FILE]
+    lanefind serve [--host HOST] [--port PORT] [--unix PATH] [--workers N] [--max-batch N]
+    lanefind stream SOURCE|- [--width W --height H] [--lanes FILE|-] [--output FILE|-] [--stats FILE]
+
+The pipeline modules are imported by the commands, not at startup, so that
+`lanefind --help` does not wait for OpenCV.
+"""
+import argparse
+import functools
+import sys
+
+
+def pipeline_config(args):
+    """Returns the PipelineConfig of the parsed `args`"""
+    from lanefind.config import PipelineConfig
+    return PipelineConfig(downscale=args.downscale, color_filter=args.color_filter, detector=args.detector)
+
+
+def frame_function(args):
+    """Returns the function to run on every frame for the parsed `args`"""
+    config = pipeline_config(args)
+    if getattr(args, 'track', False):
+        from lanefind.tracker import LaneTracker
+        return LaneTracker(config=config).process_image
+    from lanefind.pipeline import process_image
+    return functools.partial(process_image, crop_to_roi=args.crop_to_roi, config=config)
+
+
+def adaptive_finder(args):
+    """Returns the AdaptiveLaneFinder of `--adaptive BUDGET`"""
+    from lanefind.adaptive import AdaptiveLaneFinder
+    return AdaptiveLaneFinder(args.adaptive, crop_to_roi=args.crop_to_roi, config=pipeline_config(args))
+
+
+def run_image(args):
+    from lanefind import profiling
+    from lanefind.batch import process_image_file
+    profiler = profiling.enable(args.profile_allocations) if args.profile else None
+    try:
+        print(process_image_file((args.input, args.output), frame_function(args)))
+    finally:
+        profiling.disable()
+    if profiler is not None:
+        profiler.write(args.profile)
+        profiler.print_summary()
+
+
+def run_video(args):
+    from lanefind.video import process_video
+    finder = adaptive_finder(args) if args.adaptive is not None else None
+    # the tracker and the adaptive finder need the frames in order, in this process
+    workers = 1 if args.track or finder is not None else args.workers
+    process_video(args.input, args.output, frame_function(args) if finder is None else finder.process_image, workers,
+                  args.queue_depth, args.profile, args.profile_allocations)
+    if finder is not None:
+        print(finder.detection_summary())
+
+
+def run_dir(args):
+    from lanefind.batch import process_directory
+    errors = []
+    for output_file in process_directory(args.input_dir, args.output_dir, frame_function(args),
+                                         args.workers, args.suffix, errors):
+        print(output_file)
+    for image_file, error in errors:
+        print('lanefind: skipped {}: {}'.format(image_file, error), file=sys.stderr)
+    if errors:
+        sys.exit('lanefind: {} images could not be processed'.format(len(errors)))
+
+
+def run_lanes(args):
+    from lanefind import profiling
+    from lanefind.records import record_video
+    if not args.output.endswith(('.jsonl', '.npy')):
+        sys.exit('lanefind: the lane records are written to a .jsonl or .npy file, not ' + args.output)
+    profiler = profiling.enable(args.profile_allocations) if args.profile else None
+    try:
+        record_video(args.input, args.output, args.crop_to_roi, pipeline_config(args), args.adaptive)
+    finally:
+        profiling.disable()
+    if profiler is not None:
+        profiler.write(args.profile)
+        profiler.print_summary()
+
+
+def run_store(args):
+    from lanefind.framestore import FrameStore
+    store = FrameStore.create(args.input, args.output_dir, args.max_frames)
+    print('{}: {} frames of {}x{}'.format(args.output_dir, len(store), store.frames.shape[2], store.frames.shape[1]))
+
+
+def run_sweep(args):
+    import json
+    from lanefind import sweep
+    space = sweep.SEARCH_SPACE
+    if args.space:
+        with open(args.space) as space_file:
+            space = json.load(space_file)
+        unknown = set(space) - set(sweep.SEARCH_SPACE)
+        if unknown:
+            sys.exit('lanefind: unknown parameters in {}: {}'.format(args.space, ', '.join(sorted(unknown))))
+    trials = sweep.random_trials(space, args.random, args.seed) if args.random else sweep.grid_trials(space)
+    frames, sequence = sweep.load_frames(args.input)
+    report = sweep.run_sweep(frames, trials, args.workers, sequence)
+    sweep.print_report(report, args.top)
+    if args.output:
+        sweep.write_report(report, args.output)
+
+
+def run_serve(args):
+    import asyncio
+    from lanefind.service import LaneService
+    service = LaneService(args.workers, args.max_batch, args.batch_window_ms / 1e3, args.queue_size,
+                          crop_to_roi=args.crop_to_roi, config=pipeline_config(args))
+
+    def ready(server):
+        address = server.sockets[0].getsockname()
+        print('lanefind: serving on ' + (args.unix or 'http://{}:{}'.format(*address[:2])), flush=True)
+
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.unix, ready))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_stream(args):
+    import json
+    import cv2
+    from lanefind.processor import FrameProcessor
+    from lanefind.records import LaneRecordWriter, lane_record, record_json
+    from lanefind.stream import CaptureReader, LatestFrameStream, RawFrameReader
+    if args.lanes == '-' and args.output == '-':
+        sys.exit('lanefind: the lane records and the frames cannot both go to stdout')
+    if args.lanes is None:
+        # the records go to stdout, unless the frames do
+        args.lanes = None if args.output == '-' else '-'
+    if args.source == '-':
+        if not (args.width and args.height):
+            sys.exit('lanefind: raw frames on stdin need --width and --height')
+        reader = RawFrameReader(sys.stdin.buffer, args.width, args.height)
+    else:
+        # a number is a camera index, anything else a device, a file or a URL
+        reader = CaptureReader(int(args.source) if args.source.isdigit() else args.source)
+    # red lines, in the channel order of the reader
+    color = (0, 0, 255) if reader.bgr else (255, 0, 0)
+    processor = FrameProcessor(args.crop_to_roi, pipeline_config(args), color=color, bgr=reader.bgr)
+    records = sys.stdout if args.lanes == '-' else LaneRecordWriter(args.lanes) if args.lanes else None
+    frames = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb') if args.output else None
+
+    def find_lanes(frame):
+        two_lines, counts, coverage = processor.find_lane_lines(frame, return_support=True)
+        if frames is None:
+            return two_lines, counts, coverage, None
+        annotated = processor.draw_lane_lines(frame, two_lines)
+        if reader.bgr:
+            cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB, dst=annotated)
+        return two_lines, counts, coverage, annotated
+
+    def write_result(index, captured, result):
+        two_lines, counts, coverage, annotated = result
+        record = lane_record(two_lines, counts, coverage, index, captured - stream.started)
+        if records is sys.stdout:
+            print(json.dumps(record_json(record)), flush=True)
+        elif records is not None:
+            records.write(record)
+        if annotated is not None:
+            frames.write(annotated.data)
+            frames.flush()
+
+    stream = LatestFrameStream(find_lanes)
+    try:
+        stream.run(reader, write_result, args.max_frames)
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    finally:
+        reader.close()
+        if records is not None and records is not sys.stdout:
+            records.close()
+        if frames is not None and frames is not sys.stdout.buffer:
+            frames.close()
+    # stdout may carry the results, the summary goes to stderr
+    stream.print_summary(sys.stderr)
+    if args.stats:
+        with open(args.stats, 'w') as stats_file:
+            json.dump(stream.summary(), stats_file, indent=1)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='lanefind', description='Finds lane lines on the road.')
+    commands = parser.add_subparsers(dest='command', metavar='{image,video,dir,lanes,store,sweep,serve,stream}')
+    commands.required = True
+
+    image = commands.add_parser('image', help='draw the lane lines on an image')
+    image.add_argument('input', help='image file to read')
+    image.add_argument('output', help='image file to write')
+    image.set_defaults(run=run_image)
+
+    video = commands.add_parser('video', help='draw the lane lines on every frame of a video')
+    video.add_argument('input', help='video file to read')
+    video.add_argument('output', help='video file to write')
+    video.add_argument('--workers', type=int, help='worker processes (default: one per core)')
+    video.add_argument('--queue-depth', type=int, help='frames in flight (default: 4 per worker)')
+    video.add_argument('--track', action='store_true',
+                       help='track the lanes across frames with LaneTracker (uses a single worker)')
+    video.set_defaults(run=run_video)
+
+    directory = commands.add_parser('dir', help='draw the lane lines on every image of a directory')
+    directory.add_argument('input_dir', help='directory of images to read')
+    directory.add_argument('output_dir', help='directory to write the images to, existing ones are skipped')
+    directory.add_argument('--workers', type=int, help='worker processes (default: one per core)')
+    directory.add_argument('--suffix', default='line_marked.jpg',
+                           help='appended to the input file name (default: %(default)s)')
+    directory.set_defaults(run=run_dir)
+
+    lanes = commands.add_parser('lanes', help='write the lane lines of every frame of a video, without drawing them')
+    lanes.add_argument('input', help='video file, or frame store directory, to read')
+    lanes.add_argument('output', help='.jsonl or .npy file to write the lane records to')
+    lanes.set_defaults(run=run_lanes)
+
+    store = commands.add_parser('store', help='decode a video once into a memory-mapped frame store')
+    store.add_argument('input', help='video file to read')
+    store.add_argument('output_dir', help='directory to write the frame store to')
+    store.add_argument('--max-frames', type=int, help='only store the first N frames')
+    store.set_defaults(run=run_store)
+
+    sweep = commands.add_parser('sweep', help='rank the pipeline parameters of a search space on images or a frame store')
+    sweep.add_argument('input', help='directory of images, or frame store directory')
+    sweep.add_argument('--space', metavar='FILE',
+                       help='JSON file of {parameter: [values]} (default: lanefind.sweep.SEARCH_SPACE)')
+    sweep.add_argument('--random', type=int, metavar='N', help='try N random combinations instead of all of them')
+    sweep.add_argument('--seed', type=int, default=0, help='seed of --random (default: %(default)s)')
+    sweep.add_argument('--workers', type=int, help='worker processes (default: one per core)')
+    sweep.add_argument('--output', metavar='FILE', help='write the ranked trials to a .csv or .json file')
+    sweep.add_argument('--top', type=int, default=10, help='trials to print (default: %(default)s)')
+    sweep.set_defaults(run=run_sweep)
+
+    serve = commands.add_parser('serve', help='find the lane lines of the frames posted to a local HTTP service')
+    serve.add_argument('--host', default='127.0.0.1', help='address to listen on (default: %(default)s)')
+    serve.add_argument('--port', type=int, default=8080, help='port to listen on, 0 for any (default: %(default)s)')
+    serve.add_argument('--unix', metavar='PATH', help='listen on a unix socket instead')
+    serve.add_argument('--workers', type=int, help='worker threads (default: one per core)')
+    serve.add_argument('--max-batch', type=int, default=8, help='requests per micro-batch (default: %(default)s)')
+    serve.add_argument('--batch-window-ms', type=float, default=2.,
+                       help='how long a batch waits for more requests (default: %(default)s)')
+    serve.add_argument('--queue-size', type=int, default=64,
+                       help='requests waiting for a worker before new ones get a 503 (default: %(default)s)')
+    serve.set_defaults(run=run_serve)
+
+    stream = commands.add_parser('stream', help='find the lane lines of a camera or a raw frame pipe, live')
+    stream.add_argument('source', help='camera index, device (/dev/video0), video file or URL for OpenCV, '
+                                       'or - for raw RGB frames on stdin')
+    stream.add_argument('--width', type=int, help='width of the raw frames on stdin')
+    stream.add_argument('--height', type=int, help='height of the raw frames on stdin')
+    stream.add_argument('--lanes', metavar='FILE',
+                        help='.jsonl or .npy file to write the lane records of the processed frames to, '
+                             '- for JSON lines on stdout (default: stdout, unless --output is)')
+    stream.add_argument('--output', metavar='FILE',
+                        help='also write the processed frames with the lane lines drawn, as raw RGB, - for stdout')
+    stream.add_argument('--max-frames', type=int, metavar='N', help='stop after reading N frames')
+    stream.add_argument('--stats', metavar='FILE', help='write the frame counts and latency percentiles to a JSON file')
+    stream.set_defaults(run=run_stream)
+
+    for command in (image, video, directory, lanes, serve, stream):
+        command.add_argument('--crop-to-roi', action='store_true',
+                             help='only run Canny and Hough on the bounding box of the region of interest')
+        command.add_argument('--downscale', type=float, default=1., metavar='FACTOR',
+                             help='find the lines on the frame resized by FACTOR, e.g. 0.5 for 1080p and 0.25 for 4K')
+        command.add_argument('--color-filter', action='store_true',
+                             help='only look for edges in white and yellow pixels')
+        command.add_argument('--detector', choices=('houghp', 'accumulator', 'sliding_window'), default='houghp',
+                             help='the line detector: cv2.HoughLinesP, a lane angle Hough accumulator in NumPy, '
+                                  'or a sliding window search (default: %(default)s)')
+    for command in (video, lanes):
+        command.add_argument('--adaptive', type=float, metavar='BUDGET',
+                             help='only run the detection on the frames whose lines cannot be predicted within '
+                                  'BUDGET of the frame height, e.g. 0.02 (uses a single worker)')
+    for command in (image, video, lanes):
+        command.add_argument('--profile', metavar='FILE',
+                             help='write the time of every pipeline stage per frame to a .csv or .json file')
+        command.add_argument('--profile-allocations', action='store_true',
+                             help='also profile the bytes allocated by every stage (slower)')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.run(args)
+    except OSError as error:
+        sys.exit('lanefind: {}'.format(error))
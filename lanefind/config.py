@@ -0,0 +1,75 @@
+"""Resolution independent parameters of the pipeline."""
+import collections
+
+import numpy as np
+
+# the parameters of PipelineConfig, in pixels for one frame shape
+PipelinePixels = collections.namedtuple('PipelinePixels', [
+    'kernel_size', 'low_threshold', 'high_threshold', 'vertices',
+    'rho', 'theta', 'threshold', 'min_line_length', 'max_line_gap'])
+
+
+class PipelineConfig:
+    """
+    The parameters of process_image(), independent of the frame resolution.
+
+    The region of interest `roi` is a polygon of (x, y) fractions of the frame
+    width and height. `rho`, `threshold`, `min_line_length` and `max_line_gap`
+    are fractions of the frame height, as the number of Hough votes a lane line
+    gets grows with its length in pixels. The blur `kernel_size` and the Canny
+    thresholds work on the gradient between neighbouring pixels and stay in
+    pixels: a wider blur flattens the gradient below the thresholds. The
+    defaults are the values tuned on the 960x540 test images, and give exactly
+    those at that size.
+
+    With `downscale` below 1, the fast mode, edges and lines are found on the
+    grayscale frame resized by that factor, and the lane lines are scaled back
+    to full resolution before they are drawn.
+
+    With `color_filter`, only the pixels with a lane line color are kept before
+    Canny, so shadows, cracks and cars give far fewer edges. `color_ranges` are
+    the (low, high) bounds of those colors in OpenCV's HLS (hue 0 to 180,
+    lightness and saturation 0 to 255): by default white, of any hue and a high
+    lightness, and yellow, a hue around 25 with a high saturation.
+
+    `detector` is the line detector that finds the segments in the edges, a
+    name of lanefind.detectors.DETECTORS: 'houghp' (cv2.HoughLinesP), the
+    lane angle 'accumulator' or the 'sliding_window' search.
+    """
+
+    def __init__(self, kernel_size=5, low_threshold=50, high_threshold=150,
+                 roi=((145 / 960, 1.), (445 / 960, 320 / 540), (540 / 960, 320 / 540), (1., 1.)),
+                 rho=2 / 540, theta=np.pi / 180, threshold=15 / 540, min_line_length=40 / 540,
+                 max_line_gap=20 / 540, downscale=1., color_filter=False,
+                 color_ranges=(((0, 200, 0), (180, 255, 255)), ((15, 30, 100), (35, 204, 255))), detector='houghp'):
+        self.kernel_size = kernel_size
+        self.low_threshold = low_threshold
+        self.high_threshold = high_threshold
+        self.roi = roi
+        self.rho = rho
+        self.theta = theta
+        self.threshold = threshold
+        self.min_line_length = min_line_length
+        self.max_line_gap = max_line_gap
+        self.downscale = downscale
+        self.color_filter = color_filter
+        self.color_ranges = color_ranges
+        self.detector = detector
+
+    def pixels(self, imshape):
+        """Returns the PipelinePixels for frames of shape `imshape`"""
+        height, width = imshape[:2]
+        return PipelinePixels(
+            kernel_size=self.kernel_size,
+            low_threshold=self.low_threshold,
+            high_threshold=self.high_threshold,
+            vertices=np.array([[(round(x * width), round(y * height)) for x, y in self.roi]], dtype=np.int32),
+            rho=max(1., self.rho * height),
+            theta=self.theta,
+            threshold=max(1, int(round(self.threshold * height))),
+            min_line_length=self.min_line_length * height,
+            max_line_gap=self.max_line_gap * height,
+        )
+
+
+DEFAULT_CONFIG = PipelineConfig()
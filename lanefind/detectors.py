@@ -0,0 +1,179 @@
+"""
+The line detectors of hough_segments(), selected with PipelineConfig(detector=NAME).
+
+Every detector takes the masked Canny edges and the Hough parameters of
+PipelinePixels (`rho`, `theta`, `threshold`, `min_line_len`, `max_line_gap`,
+in pixels of the working frame), and returns line segments in the format of
+cv2.HoughLinesP(), an (N, 1, 4) array of [x1, y1, x2, y2], or None.
+
+    houghp          cv2.HoughLinesP(), the detector of the notebook
+    accumulator     a Hough transform in NumPy that only votes for the angles
+                    a lane line can have, and cuts the strongest lines into
+                    segments where their edge pixels have gaps
+    sliding_window  finds the bottom of each line in a histogram of the edge
+                    columns, then follows it up the frame with a window that
+                    recenters on the edge pixels inside it
+
+HoughLinesP votes over all 180 angles, and its time grows with the number
+of edge pixels and gives many short, overlapping segments. The other two
+give a few long segments per line.
+"""
+import cv2
+import numpy as np
+
+# the angles from the horizontal a lane line can have in the frame, in radians
+LANE_ANGLES = (np.radians(20), np.radians(75))
+
+# the lines the accumulator cuts into segments, per side of the frame
+MAX_LINES = 4
+
+# the rows of windows the sliding window detector follows each line with
+WINDOWS = 8
+
+
+def houghp_segments(edges, rho, theta, threshold, min_line_len, max_line_gap):
+    """The segments of cv2.HoughLinesP()"""
+    return cv2.HoughLinesP(edges, rho, theta, threshold, np.array([]), minLineLength=min_line_len,
+                           maxLineGap=max_line_gap)
+
+
+def run_segments(along, min_line_len, max_line_gap):
+    """
+    Returns the (start, end) index pairs of the runs of the sorted positions
+    `along` a line that have no gap over `max_line_gap` and are at least
+    `min_line_len` long.
+    """
+    breaks = np.flatnonzero(np.diff(along) > max_line_gap)
+    starts = np.concatenate([[0], breaks + 1])
+    ends = np.concatenate([breaks, [len(along) - 1]])
+    long_enough = along[ends] - along[starts] >= min_line_len
+    return zip(starts[long_enough], ends[long_enough])
+
+
+def accumulator_segments(edges, rho, theta, threshold, min_line_len, max_line_gap):
+    """
+    The segments of the strongest lines of a Hough accumulator over the lane
+    angles only: for every edge pixel, the distances rho = x cos(θ) + y sin(θ)
+    of all the normal angles θ of lane lines are computed as one matrix and
+    counted with np.bincount(). The MAX_LINES peaks of each side with at least
+    `threshold` votes, each away from the stronger ones, are cut into segments
+    at the gaps of their edge pixels.
+    """
+    pixels = cv2.findNonZero(edges)
+    if pixels is None:
+        return None
+    xs, ys = pixels.reshape(-1, 2).T
+    # the normals of the lines that lean right towards the top (the left lane
+    # line), and of those that lean left
+    low, high = LANE_ANGLES
+    sides = [np.arange(np.pi / 2 - high, np.pi / 2 - low + theta / 2, theta),
+             np.arange(np.pi / 2 + low, np.pi / 2 + high + theta / 2, theta)]
+    thetas = np.concatenate(sides)
+    max_rho = np.hypot(*edges.shape)
+    rho_bins = int(np.ceil(2 * max_rho / rho)) + 1
+    # the accumulator cell of every (edge pixel, angle) in one matrix product:
+    # the bin of rho, offset to be positive, in the row of bins of the angle
+    cells = (np.column_stack([xs, ys, np.ones_like(xs)]).astype(np.float32) @ np.array([
+        np.cos(thetas) / rho, np.sin(thetas) / rho,
+        max_rho / rho + 0.5 + np.arange(len(thetas)) * rho_bins], dtype=np.float32)).astype(np.intp)
+    votes = np.bincount(cells.ravel(), minlength=len(thetas) * rho_bins).reshape(len(thetas), rho_bins)
+
+    segments = []
+    # neighbouring cells of a peak are the same line
+    suppress_angles, suppress_rhos = 3, max(int(round(min_line_len / rho / 4)), 2)
+    first = 0
+    for side_thetas in sides:
+        side_votes = votes[first:first + len(side_thetas)].copy()
+        for _ in range(MAX_LINES):
+            angle, bin_ = np.unravel_index(np.argmax(side_votes), side_votes.shape)
+            if side_votes[angle, bin_] < threshold:
+                break
+            side_votes[max(angle - suppress_angles, 0):angle + suppress_angles + 1,
+                       max(bin_ - suppress_rhos, 0):bin_ + suppress_rhos + 1] = 0
+            # the edge pixels of the line and its neighbouring bins, sorted along it
+            on_line = np.flatnonzero(np.abs(cells[:, first + angle] - ((first + angle) * rho_bins + bin_)) <= 1)
+            cos, sin = np.cos(thetas[first + angle]), np.sin(thetas[first + angle])
+            along = xs[on_line] * -sin + ys[on_line] * cos
+            order = np.argsort(along)
+            on_line, along = on_line[order], along[order]
+            for start, end in run_segments(along, min_line_len, max_line_gap):
+                segments.append([xs[on_line[start]], ys[on_line[start]], xs[on_line[end]], ys[on_line[end]]])
+        first += len(side_thetas)
+    return np.array(segments, dtype=np.int32).reshape(-1, 1, 4) if segments else None
+
+
+def sliding_window_segments(edges, rho, theta, threshold, min_line_len, max_line_gap):
+    """
+    The segments of a sliding window search, with windows of a WINDOWS-th of
+    the height of the edge pixels, `min_line_len` wide on either side.
+
+    The lane lines meet towards the top middle of the edge pixels, so the
+    column sums are taken along the rays from there: every edge pixel counts
+    for the column its ray reaches the bottom row at, summed over `min_line_len`
+    columns. The highest column on either side of the meeting point is the
+    bottom of a line, and windows follow it up, twice as wide until they find
+    it: a window with `threshold` edge pixels or more, over a third of its
+    height, centers the next one on their least squares line, an
+    emptier one, the gap of a dashed line, moves the next one along the line
+    before. Each window gives a segment along the least squares line of all
+    the windows of its side.
+    """
+    pixels = cv2.findNonZero(edges)
+    if pixels is None:
+        return None
+    xs, ys = pixels.reshape(-1, 2).T
+    top, bottom = ys.min(), ys.max() + 1
+    window_height = (bottom - top) / WINDOWS
+    margin = int(min_line_len)
+    # the meeting point, a window above the top edge pixels
+    meet_x, meet_y = np.median(xs[ys < top + window_height]), top - window_height
+    bottom_xs = meet_x + (xs - meet_x) * (bottom - meet_y) / (ys - meet_y)
+    inside_frame = (bottom_xs >= 0) & (bottom_xs < edges.shape[1])
+    columns = np.bincount(bottom_xs[inside_frame].astype(np.intp), minlength=edges.shape[1])
+    columns = np.convolve(columns, np.ones(margin + 1, dtype=np.int64), 'same')
+
+    segments = []
+    for half in (slice(0, int(meet_x)), slice(int(meet_x), edges.shape[1])):
+        if half.stop <= half.start or columns[half].max() < threshold:
+            continue
+        x = half.start + np.argmax(columns[half])
+        step = (meet_x - x) / (bottom - meet_y) * window_height
+        center_x, center_y = x + step / 2, bottom - window_height / 2
+        windows = []
+        for _ in range(WINDOWS):
+            # cv2.findNonZero() gives the pixels row by row, so the rows of a window are a slice
+            rows = slice(*np.searchsorted(ys, [center_y - window_height / 2, center_y + window_height / 2]))
+            # twice as wide until the line is found, the column sums only give its bottom roughly
+            width = margin if windows else 2 * margin
+            inside = rows.start + np.flatnonzero(np.abs(xs[rows] - center_x) <= width)
+            # the pixels of a window must span a third of it to give a line
+            if len(inside) >= threshold and ys[inside[-1]] - ys[inside[0]] >= window_height / 3:
+                a, c = fit_line(xs[inside], ys[inside])
+                step = -a * window_height
+                center_x = a * center_y + c
+                windows.append(inside)
+            center_x += step
+            center_y -= window_height
+        if not windows:
+            continue
+        on_line = np.concatenate(windows)
+        a, c = fit_line(xs[on_line], ys[on_line])
+        for inside in windows:
+            y1, y2 = ys[inside[-1]], ys[inside[0]]
+            segments.append([a * y1 + c, y1, a * y2 + c, y2])
+    return np.rint(np.array(segments)).astype(np.int32).reshape(-1, 1, 4) if segments else None
+
+
+def fit_line(xs, ys):
+    """Returns the (a, c) of the least squares line x = a * y + c through the pixels `xs`, `ys`"""
+    ys = ys.astype(np.float64)
+    center_x, center_y = xs.mean(), ys.mean()
+    a = ((ys - center_y) * (xs - center_x)).sum() / ((ys - center_y) ** 2).sum()
+    return a, center_x - a * center_y
+
+
+DETECTORS = {
+    'houghp': houghp_segments,
+    'accumulator': accumulator_segments,
+    'sliding_window': sliding_window_segments,
+}
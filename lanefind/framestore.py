@@ -0,0 +1,134 @@
+"""
+Video frames decoded once into a memory-mapped store on disk.
+
+    lanefind store drive.mp4 drive.frames/
+    lanefind lanes drive.frames/ drive.npy
+
+A store is a directory with `frames.u8`, the RGB frames back to back as one
+(frame count, height, width, 3) uint8 array, and `index.json` with its
+shape, the frame rate and the source video. FrameStore maps the array
+read-only, so a run reads the frames straight from the page cache without
+copying or decoding them, and the decoding is only paid once.
+
+Intermediate stages are stored next to the frames. blurred_gray() computes
+the blurred grayscale of every frame once for each set of the parameters it
+depends on (the blur kernel, downscale, color filter and crop), so runs that
+only change the Canny and Hough parameters start from it. Each stage has its
+own `<stage>-<key hash>.u8` array and `.json` metadata, written to temporary
+files and renamed, so processes that add stages to the same store at once
+never overwrite each other's.
+"""
+import hashlib
+import json
+import os
+
+import cv2
+import numpy as np
+
+from lanefind import profiling
+from lanefind.config import DEFAULT_CONFIG
+from lanefind.pipeline import blurred_gray, find_lane_lines_in_blur
+from lanefind.video import read_video, video_fps
+
+INDEX_FILE = 'index.json'
+FRAMES_FILE = 'frames.u8'
+
+
+class FrameStore:
+    """The frames and cached stages of a store directory, see create()"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        try:
+            with open(os.path.join(directory, INDEX_FILE)) as index:
+                self.index = json.load(index)
+        except FileNotFoundError:
+            raise IOError('not a frame store, no {} in {}'.format(INDEX_FILE, directory))
+        self.fps = self.index['fps']
+        # (frame count, height, width, 3) uint8, read-only
+        self.frames = self.open_array(FRAMES_FILE, self.index['shape'])
+
+    @classmethod
+    def create(cls, video, directory, max_frames=None):
+        """Decodes the video file `video`, or its first `max_frames` frames, into a store in `directory`"""
+        os.makedirs(directory, exist_ok=True)
+        partial_path = os.path.join(directory, '.partial-{}-{}'.format(os.getpid(), FRAMES_FILE))
+        frame_count = 0
+        rgb = None
+        with open(partial_path, 'wb') as output:
+            for frame in read_video(video):
+                if frame_count == max_frames:
+                    break
+                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb)
+                output.write(rgb)
+                frame_count += 1
+        if frame_count == 0:
+            os.remove(partial_path)
+            raise IOError('no frames in video file ' + video)
+        os.replace(partial_path, os.path.join(directory, FRAMES_FILE))
+        write_json(directory, INDEX_FILE, {
+            'source': os.path.abspath(video),
+            'fps': video_fps(video),
+            'shape': [frame_count] + list(rgb.shape),
+        })
+        return cls(directory)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    def open_array(self, file_name, shape):
+        return np.memmap(os.path.join(self.directory, file_name), dtype=np.uint8, mode='r', shape=tuple(shape))
+
+    def stage(self, name, key, compute):
+        """
+        Returns the cached stage `name` for the parameters `key`, a dict, as a
+        read-only array of one result per frame. On first use it is computed
+        with `compute(frame)` for every frame, and stored.
+        """
+        file_name = '{}-{}'.format(name, hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:12])
+        try:
+            with open(os.path.join(self.directory, file_name + '.json')) as metadata:
+                stage = json.load(metadata)
+        except FileNotFoundError:
+            partial_path = os.path.join(self.directory, '.partial-{}-{}.u8'.format(os.getpid(), file_name))
+            with open(partial_path, 'wb') as output:
+                for frame in self.frames:
+                    result = compute(frame)
+                    output.write(np.ascontiguousarray(result, dtype=np.uint8))
+            os.replace(partial_path, os.path.join(self.directory, file_name + '.u8'))
+            stage = {'name': name, 'key': key, 'shape': [len(self.frames)] + list(result.shape)}
+            # the metadata goes last, so a stage with metadata is complete
+            write_json(self.directory, file_name + '.json', stage)
+        return self.open_array(file_name + '.u8', stage['shape'])
+
+    def blurred_gray(self, crop_to_roi=False, config=None):
+        """Returns the blurred_gray() of every frame, from the cache"""
+        config = config or DEFAULT_CONFIG
+        key = {
+            'kernel_size': config.kernel_size,
+            'downscale': config.downscale,
+            'color_ranges': config.color_ranges if config.color_filter else None,
+            'roi': config.roi if crop_to_roi else None,
+        }
+        return self.stage('blurred_gray', key, lambda frame: blurred_gray(frame, crop_to_roi, config))
+
+    def lane_lines(self, crop_to_roi=False, config=None, return_support=False):
+        """Yields the find_lane_lines() of every frame, starting from the cached blurred_gray()"""
+        imshape = tuple(self.index['shape'][1:])
+        for blur_gray in self.blurred_gray(crop_to_roi, config):
+            with profiling.frame():
+                yield find_lane_lines_in_blur(blur_gray, imshape, crop_to_roi, config, return_support)
+
+
+def write_json(directory, file_name, value):
+    """Replaces the JSON file `file_name` of the store in `directory`"""
+    partial_path = os.path.join(directory, '.partial-{}-{}'.format(os.getpid(), file_name))
+    with open(partial_path, 'w') as output:
+        json.dump(value, output, indent=1)
+    os.replace(partial_path, os.path.join(directory, file_name))
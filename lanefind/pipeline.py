@@ -0,0 +1,499 @@
+"""The lane finding pipeline: the helper functions and process_image()."""
+import collections
+import functools
+
+import cv2
+import numpy as np
+
+from lanefind import profiling
+from lanefind.config import DEFAULT_CONFIG
+from lanefind.detectors import DETECTORS
+
+# the geometry of the working frame of find_lane_lines(), see frame_geometry()
+FrameGeometry = collections.namedtuple('FrameGeometry', ['params', 'box', 'scale', 'vertices'])
+
+# pixels around the region of interest the crop keeps for the Canny hysteresis, see frame_geometry()
+CANNY_MARGIN = 16
+
+
+def grayscale(img):
+    """Applies the Grayscale transform
+    This will return an image with only one color channel
+    but NOTE: to see the returned image as grayscale
+    (assuming your grayscaled image is called 'gray')
+    you should call plt.imshow(gray, cmap='gray')"""
+    return cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    # Or use BGR2GRAY if you read an image with cv2.imread()
+    # return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+def lane_color_mask(img, color_ranges):
+    """
+    Returns a mask of the pixels of the RGB `img` that have the color of a
+    lane line, that is inside one of the (low, high) HLS `color_ranges`.
+    """
+    hls = cv2.cvtColor(img, cv2.COLOR_RGB2HLS)
+    mask = cv2.inRange(hls, *color_ranges[0])
+    for low, high in color_ranges[1:]:
+        cv2.bitwise_or(mask, cv2.inRange(hls, low, high), dst=mask)
+    return mask
+
+def canny(img, low_threshold, high_threshold):
+    """Applies the Canny transform"""
+    return cv2.Canny(img, low_threshold, high_threshold)
+
+def gaussian_blur(img, kernel_size):
+    """Applies a Gaussian Noise kernel"""
+    return cv2.GaussianBlur(img, (kernel_size, kernel_size), 0)
+
+@functools.lru_cache(maxsize=32)
+def roi_mask(shape, dtype, vertices):
+    """
+    Returns the mask used by region_of_interest().
+
+    The arguments must be hashable: `dtype` is a dtype string and `vertices`
+    a tuple of polygons, each a tuple of (x, y) tuples. The masks of the last
+    32 (shape, dtype, vertices) keys are cached, so the polygon is only
+    rasterized once per video resolution. The returned mask is read-only.
+    """
+    #defining a blank mask to start with
+    mask = np.zeros(shape, dtype=dtype)
+
+    #defining a 3 channel or 1 channel color to fill the mask with depending on the input image
+    if len(shape) > 2:
+        channel_count = shape[2]  # i.e. 3 or 4 depending on your image
+        ignore_mask_color = (255,) * channel_count
+    else:
+        ignore_mask_color = 255
+
+    #filling pixels inside the polygon defined by "vertices" with the fill color
+    cv2.fillPoly(mask, [np.array(polygon, dtype=np.int32) for polygon in vertices], ignore_mask_color)
+    mask.setflags(write=False)
+    return mask
+
+def region_of_interest(img, vertices):
+    """
+    Applies an image mask.
+
+    Only keeps the region of the image defined by the polygon
+    formed from `vertices`. The rest of the image is set to black.
+    """
+    vertices = tuple(tuple(map(tuple, np.asarray(polygon).reshape(-1, 2).tolist())) for polygon in vertices)
+    mask = roi_mask(img.shape, img.dtype.str, vertices)
+
+    #returning the image only where mask pixels are nonzero
+    masked_image = cv2.bitwise_and(img, mask)
+    return masked_image
+
+def roi_bounding_box(vertices, imshape, margin=0):
+    """
+    Returns the bounding box (x1, y1, x2, y2) of the polygons in `vertices`,
+    grown by `margin` pixels on every side and clipped to an image of `imshape`.
+    """
+    points = np.concatenate([np.asarray(polygon).reshape(-1, 2) for polygon in vertices])
+    x1, y1 = np.maximum(points.min(axis=0) - margin, 0)
+    x2, y2 = np.minimum(points.max(axis=0) + margin + 1, [imshape[1], imshape[0]])
+    return int(x1), int(y1), int(x2), int(y2)
+
+
+def fit_lane_lines(lines, imshape, slope_tolerance=0.15, return_support=False):
+    """
+    Averages and extrapolates Hough line segments to one line per lane side.
+
+    `lines` is the output of cv2.HoughLinesP(), an (N, 1, 4) array.
+    All segments are handled as one matrix: lengths, slopes and midpoints are
+    computed at once, the sides are split with boolean masks and each side is
+    fitted with a length-weighted least-squares line x = a * y + c.
+
+    Returns a (2, 4) float array of [x1, y1, x2, y2] rows, the sample side
+    (the side of the longest segment) first. A side without segments is a
+    row of NaN.
+
+    With `return_support`, also returns the number of segments of each side,
+    and the fraction of the height of each line that its segments cover, as
+    two arrays of 2. Dashed and faint lines cover less of their height.
+    """
+    two_lines = np.full((2, 4), np.nan)
+    counts = np.zeros(2, dtype=np.int64)
+    coverage = np.zeros(2)
+    if lines is None or len(lines) == 0:
+        return (two_lines, counts, coverage) if return_support else two_lines
+    segments = np.asarray(lines, dtype=np.float64).reshape(-1, 4)
+    x1, y1, x2, y2 = segments.T
+    dx = x2 - x1
+    dy = y2 - y1
+
+    # step 1: lengths, slopes and midpoints of every segment in one pass
+    lengths = np.hypot(dx, dy)
+    mid_x = (x1 + x2) / 2
+    mid_y = (y1 + y2) / 2
+
+    # step 2: split the segments by comparing against the slope of the longest one.
+    # Vertical segments have an infinite slope, and inf - inf is NaN: never on the sample side
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = dy / dx
+        slope_sample = slopes[np.argmax(lengths)]
+        on_sample_side = np.abs(slope_sample - slopes) < slope_tolerance
+    sides = (on_sample_side, ~on_sample_side)
+
+    # step 3: extrapolate from the bottom of the image up to the highest segment point
+    bottom_y = imshape[0]
+    top_y = min(segments[:, [1, 3]].min(), bottom_y)
+
+    # step 4: length-weighted least squares fit of x = a * y + c for each side,
+    # using both end points of every segment
+    for idx, side in enumerate(sides):
+        weights = lengths[side]
+        total = weights.sum()
+        counts[idx] = len(weights)
+        if total == 0:
+            continue
+        center_x = (weights * mid_x[side]).sum() / total
+        center_y = (weights * mid_y[side]).sum() / total
+        ys = segments[side][:, [1, 3]] - center_y
+        xs = segments[side][:, [0, 2]] - center_x
+        variance = (weights[:, None] * ys * ys).sum()
+        if variance == 0:
+            continue
+        a = (weights[:, None] * ys * xs).sum() / variance
+        two_lines[idx] = [center_x + a * (bottom_y - center_y), bottom_y,
+                          center_x + a * (top_y - center_y), top_y]
+        if return_support and bottom_y > top_y:
+            # the length of the union of the y ranges of the segments
+            starts = segments[side][:, [1, 3]].min(axis=1)
+            order = np.argsort(starts)
+            starts = starts[order]
+            ends = segments[side][:, [1, 3]].max(axis=1)[order]
+            reached = np.concatenate([[-np.inf], np.maximum.accumulate(ends)[:-1]])
+            coverage[idx] = np.maximum(ends - np.maximum(starts, reached), 0).sum() / (bottom_y - top_y)
+    return (two_lines, counts, coverage) if return_support else two_lines
+
+
+def left_right_order(two_lines):
+    """
+    Returns the row of the left and of the right line in the output of fit_lane_lines().
+
+    Of two lines, the one further left at the bottom of the image is the left
+    one. A single line is the left one when it leans to the right towards the
+    top of the image. A missing side gets the row of NaN.
+    """
+    found = ~np.isnan(two_lines).any(axis=1)
+    if found.all():
+        return np.argsort(two_lines[:, 0], kind='stable')
+    if found.any():
+        row = int(np.argmax(found))
+        x1, _, x2, _ = two_lines[row]
+        return np.array([row, 1 - row] if x2 > x1 else [1 - row, row])
+    return np.arange(2)
+
+
+def left_right_lines(two_lines):
+    """Returns the lines of fit_lane_lines() ordered as [left, right], see left_right_order()"""
+    return two_lines[left_right_order(two_lines)]
+
+
+def lane_line_errors(lines, reference, height, top_y):
+    """
+    Returns the distance of each of `lines` from the same row of `reference`,
+    two arrays of [x1, y1, x2, y2] rows, as a fraction of `height`: the largest
+    horizontal distance at the bottom of the frame and at `top_y`. A line
+    missing from `lines` or from `reference` is 1 away.
+    """
+    def x_at(lines, y):
+        x1, y1, x2, y2 = np.moveaxis(lines, -1, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return x1 + (x2 - x1) * (y - y1) / (y2 - y1)
+    errors = np.maximum(np.abs(x_at(lines, height) - x_at(reference, height)),
+                        np.abs(x_at(lines, top_y) - x_at(reference, top_y))) / height
+    return np.minimum(np.nan_to_num(errors, nan=1.), 1.)
+
+
+def draw_lines(img, lines, color=[255, 0, 0], thickness=10):
+    """
+    NOTE: this is the function you might want to use as a starting point once you want to
+    average/extrapolate the line segments you detect to map out the full
+    extent of the lane (going from the result shown in raw-lines-example.mp4
+    to that shown in P1_example.mp4).
+
+    Think about things like separating line segments by their
+    slope ((y2-y1)/(x2-x1)) to decide which segments are part of the left
+    line vs. the right line.  Then, you can average the position of each of
+    the lines and extrapolate to the top and bottom of the lane.
+
+    This function draws `lines` with `color` and `thickness`.
+    Lines are drawn on the image inplace (mutates the image).
+    If you want to make the lines semi-transparent, think about combining
+    this function with the weighted_img() function below
+    """
+    draw_lane_lines(img, fit_lane_lines(lines, img.shape), color, thickness)
+
+
+def draw_lane_lines(img, two_lines, color=[255, 0, 0], thickness=10):
+    """Draws the lines of fit_lane_lines() on `img` inplace, skipping the NaN ones"""
+    for x1, y1, x2, y2 in two_lines[~np.isnan(two_lines).any(axis=1)].astype(int):
+        cv2.line(img, (x1, y1), (x2, y2), color, thickness)
+
+
+def draw_lines_iterative(img, lines, color=[255, 0, 0], thickness=10):
+    """
+    The original loop based version of draw_lines().
+
+    Kept as a reference for the vectorized version above, and for
+    benchmarks/draw_lines.py and benchmarks/golden.py.
+    """
+    for x1, y1, x2, y2 in fit_lane_lines_iterative(lines, img.shape).astype(int):
+        cv2.line(img, (x1, y1), (x2, y2), color, thickness)
+
+def fit_lane_lines_iterative(lines, imgshape):
+    """
+    The lines draw_lines_iterative() draws, as the (2, 4) array of
+    fit_lane_lines(): the line of the longest segment of each side,
+    extrapolated from the bottom of the image to the highest segment point.
+    """
+    # get y coordinate of the highest point for future use
+    top_y_coordinate = imgshape[0]
+
+    # step 1: calculate a slope for one of the longest line segments
+
+    # to get a more accurate slope, find the longest line segment first
+    longest_line = np.array([[0, 0, 0, 0]])
+    for line in lines:
+        x1_ll, y1_ll, x2_ll, y2_ll = longest_line[0][0], longest_line[0][1], \
+            longest_line[0][2], longest_line[0][3]
+        for x1, y1, x2, y2 in line:
+            if (x1 - x2) ** 2 + (y1 - y2) ** 2 > (x1_ll - x2_ll) ** 2 + (y1_ll - y2_ll) ** 2:
+                longest_line = line
+    # now calculate slope for one side, call it sample side
+    # line in lines is a nested np.array like [[1,2,3,4]]
+    line_sample = longest_line[0]
+    x1, y1, x2, y2 = line_sample[0], line_sample[1], line_sample[2], line_sample[3]
+    slope_sample = (y2 - y1) / (x2 - x1)
+    # find the middle point of the longest line for the sample side, extract the resulting nested array
+    # we will user the point to calculate the interception point for y = m * x + b
+    # same goes for the other side
+    mid_point_sample = [np.array([abs((x2 - x1) / 2) + min(x1, x2), abs((y2 - y1) / 2) + min(y1, y2)]) \
+        for (x1, y1, x2, y2) in longest_line][0]
+
+    # step2: classify all lines to two groups, according to the slope we find in step 1
+    #
+    # seperate lines to two sides, respectively, base on the slope
+    lines_on_sample_side = []
+    lines_on_other_side = []
+    for line in lines:
+        for x1, y1, x2, y2 in line:
+            if y1 < top_y_coordinate:
+                top_y_coordinate = y1
+            if y2 < top_y_coordinate:
+                top_y_coordinate = y2
+            if abs(slope_sample - (y2 - y1) / (x2 - x1)) < 0.15:
+                lines_on_sample_side.append(line)
+            else:
+                lines_on_other_side.append(line)
+    lines_on_sample_side = np.array(lines_on_sample_side)
+    lines_on_the_other_side = np.array(lines_on_other_side)
+    # step 3:
+    # calculate the slope for the other side
+    # first find the longest line for the other side
+    longest_line = np.array([[0, 0, 0, 0]])
+    for line in lines_on_other_side:
+        x1_ll, y1_ll, x2_ll, y2_ll = longest_line[0][0], longest_line[0][1], \
+            longest_line[0][2], longest_line[0][3]
+        for x1, y1, x2, y2 in line:
+            if (x1 - x2) ** 2 + (y1 - y2) ** 2 > (x1_ll - x2_ll) ** 2 + (y1_ll - y2_ll) ** 2:
+                longest_line = line
+    # get the longest line from the other side and calculate the slope
+    line_other = longest_line[0]
+    x1, y1, x2, y2 = line_other[0], line_other[1], line_other[2], line_other[3]
+    slope_other = (y2 - y1) / (x2 - x1)
+    # find the middle point of the longest line for the other side, extract the resulting nested array
+    # we will user the point to calculate the interception point for y = m * x + b
+    # same goes for the other side
+    mid_point_other = [np.array([abs((x2 - x1) / 2) + min(x1, x2), abs((y2 - y1) / 2) + min(y1, y2)]) \
+        for (x1, y1, x2, y2) in longest_line][0]
+
+    # step 4: find the top point and bottom point for both sides
+    # and connect each pair to form a single long line for each side
+
+    # to find the bottom point and the top point for the sample side
+    # first find b in y = m * x + b
+    interception_sample_line = mid_point_sample[1] - slope_sample * mid_point_sample[0]
+    # for bottom point we already know the y coordinate
+    bottom_x_sample_side = (imgshape[0] - interception_sample_line) / slope_sample
+    bottom_point_sample_side = np.array([bottom_x_sample_side, imgshape[0]])
+    # find point with smallest y coordinate thus the highest point of both side
+    # we now have the y coordinate, now find x coordinate
+    top_x_sample_side = (top_y_coordinate - interception_sample_line) / slope_sample
+    # now combine top and bottom points to form a longest line segment
+    line_sample_side = [np.append(bottom_point_sample_side, [top_x_sample_side, top_y_coordinate])]
+    # now for the other side
+    interception_other_line = mid_point_other[1] - slope_other * mid_point_other[0]
+    bottom_x_other_side = (imgshape[0] - interception_other_line) / slope_other
+    bottom_point_other_side = np.array([bottom_x_other_side, imgshape[0]])
+
+    top_x_other_side = (top_y_coordinate - interception_other_line) / slope_other
+    line_other_side = [np.append(bottom_point_other_side, [top_x_other_side, top_y_coordinate])]
+
+    # step 5: combine the two lines
+
+    # two_lines is of the form [[1,2,3,4],[5,6,7,8]]
+    return np.array([line_sample_side, line_other_side]).reshape(2, 4)
+
+def hough_segments(img, rho, theta, threshold, min_line_len, max_line_gap, offset=(0, 0), scale=1.,
+                   detector='houghp'):
+    """
+    `img` should be the output of a Canny transform.
+    If `img` is a crop of a larger image, `offset` is the (x, y) position of the
+    crop in it. If `img` was resized by `scale`, the segments are scaled back.
+    `detector` is the name of a line detector of lanefind.detectors, by
+    default cv2.HoughLinesP().
+
+    Returns the segments in the coordinates of the larger image, or None.
+    """
+    with profiling.stage('hough'):
+        lines = DETECTORS[detector](img, rho, theta, threshold, min_line_len, max_line_gap)
+    profiling.count('segments', 0 if lines is None else len(lines))
+    if lines is not None:
+        lines = lines / scale + np.array(offset * 2)
+    return lines
+
+def hough_lines(img, rho, theta, threshold, min_line_len, max_line_gap, offset=(0, 0), imshape=None,
+                detector='houghp'):
+    """
+    `img` should be the output of a Canny transform.
+    If `img` is a crop of a larger image of shape `imshape`, `offset` is the
+    (x, y) position of the crop in it, and the lines are drawn in the larger image.
+    `detector` selects the line detector, see hough_segments().
+
+    Returns an image with hough lines drawn.
+    """
+    lines = hough_segments(img, rho, theta, threshold, min_line_len, max_line_gap, offset, detector=detector)
+    with profiling.stage('draw_lines'):
+        imshape = imshape or img.shape
+        line_img = np.zeros((imshape[0], imshape[1], 3), dtype=np.uint8)
+        draw_lines(line_img, lines)
+    return line_img
+
+# Python 3 has support for cool math symbols.
+
+def weighted_img(img, initial_img, α=0.8, β=1., λ=0.):
+    """
+    `img` is the output of the hough_lines(), An image with lines drawn on it.
+    Should be a blank image (all black) with lines drawn on it.
+
+    `initial_img` should be the image before any processing.
+
+    The result image is computed as follows:
+
+    initial_img * α + img * β + λ
+    NOTE: initial_img and img must be the same shape!
+    """
+    return cv2.addWeighted(initial_img, α, img, β, λ)
+
+
+def frame_geometry(imshape, crop_to_roi=False, config=None):
+    """
+    Returns the FrameGeometry of find_lane_lines() for frames of shape `imshape`:
+    the PipelinePixels for the working frame, the (x1, y1, x2, y2) box of the
+    frame that is looked at, the downscale factor, and the region of interest
+    in working frame coordinates.
+    """
+    config = config or DEFAULT_CONFIG
+    full = config.pixels(imshape)
+
+    # with crop_to_roi, only the bounding box of the region of interest goes through
+    # Canny and Hough, the upper part of the frame is never looked at.
+    # The margin covers the blur, and the Canny hysteresis that follows weak edges
+    # across the border of the box: with the blur kernel alone, the edges on the top
+    # row of the region differ on two test images, with CANNY_MARGIN more they are
+    # the same on the test images and the synthetic frames. Hysteresis has no bound,
+    # so this is not a guarantee, and HoughLinesP samples the same edges in another
+    # order in a smaller image anyway: the lines still move, by up to 29 px on the test images
+    x1, y1, x2, y2 = roi_bounding_box(full.vertices, imshape, margin=full.kernel_size + CANNY_MARGIN) \
+        if crop_to_roi else (0, 0, imshape[1], imshape[0])
+
+    # in the fast mode, edges and lines are found on a downscaled frame,
+    # with the parameters for its size
+    scale = config.downscale
+    params = full
+    if scale != 1:
+        # INTER_AREA already averages away some of the noise, so the blur shrinks with the frame
+        params = config.pixels((imshape[0] * scale, imshape[1] * scale))._replace(
+            kernel_size=max(3, int(round(full.kernel_size * scale)) | 1))
+    vertices = np.round((full.vertices - [x1, y1]) * scale).astype(np.int32)
+    return FrameGeometry(params, (x1, y1, x2, y2), scale, vertices)
+
+
+def blurred_gray(image, crop_to_roi=False, config=None):
+    """Runs the pipeline of find_lane_lines() up to the blurred grayscale working frame"""
+    config = config or DEFAULT_CONFIG
+    geometry = frame_geometry(image.shape, crop_to_roi, config)
+    x1, y1, x2, y2 = geometry.box
+    with profiling.stage('grayscale'):
+        gray = grayscale(image[y1:y2, x1:x2])
+
+    if config.color_filter:
+        with profiling.stage('color_filter'):
+            gray = cv2.bitwise_and(gray, lane_color_mask(image[y1:y2, x1:x2], config.color_ranges))
+
+    if geometry.scale != 1:
+        with profiling.stage('downscale'):
+            gray = cv2.resize(gray, None, fx=geometry.scale, fy=geometry.scale, interpolation=cv2.INTER_AREA)
+
+    with profiling.stage('gaussian_blur'):
+        return gaussian_blur(gray, geometry.params.kernel_size)
+
+
+def find_lane_lines_in_blur(blur_gray, imshape, crop_to_roi=False, config=None, return_support=False):
+    """
+    Runs the rest of find_lane_lines() on `blur_gray`, the output of
+    blurred_gray() for a frame of shape `imshape` and the same arguments.
+    """
+    geometry = frame_geometry(imshape, crop_to_roi, config)
+    params = geometry.params
+    with profiling.stage('canny'):
+        edges = canny(blur_gray, params.low_threshold, params.high_threshold)
+
+    with profiling.stage('region_of_interest'):
+        masked_edges = region_of_interest(edges, geometry.vertices)
+        if profiling.active():
+            profiling.count('edge_pixels', cv2.countNonZero(masked_edges))
+
+    lines = hough_segments(masked_edges, params.rho, params.theta, params.threshold,
+                           params.min_line_length, params.max_line_gap, offset=geometry.box[:2], scale=geometry.scale,
+                           detector=(config or DEFAULT_CONFIG).detector)
+
+    with profiling.stage('fit_lane_lines'):
+        return fit_lane_lines(lines, imshape, return_support=return_support)
+
+
+def find_lane_lines(image, crop_to_roi=False, config=None, return_support=False):
+    """
+    Runs the pipeline of process_image() up to the fitted lane lines.
+
+    Returns the (2, 4) array of fit_lane_lines(), in full resolution
+    coordinates of `image`, and with `return_support` the segment counts and
+    coverage of each side too. `config` is a PipelineConfig, by default the
+    parameters tuned on the test images.
+
+    The pipeline is split in blurred_gray() and find_lane_lines_in_blur(), so
+    that parameter sweeps can start from a cached blurred frame.
+    """
+    with profiling.frame():
+        return find_lane_lines_in_blur(blurred_gray(image, crop_to_roi, config), image.shape, crop_to_roi, config,
+                                       return_support)
+
+
+def process_image(image, crop_to_roi=False, config=None):
+    # NOTE: The output you return should be a color image (3 channel) for processing video below
+    # TODO: put your pipeline here,
+    # you should return the final output (image where lines are drawn on lanes)
+    with profiling.frame():
+        two_lines = find_lane_lines(image, crop_to_roi, config)
+
+        with profiling.stage('draw_lines'):
+            line_img = np.zeros((image.shape[0], image.shape[1], 3), dtype=np.uint8)
+            draw_lane_lines(line_img, two_lines)
+
+        with profiling.stage('weighted_img'):
+            line_marked_img = weighted_img(line_img, image)
+        result = line_marked_img
+        return result
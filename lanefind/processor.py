@@ -0,0 +1,160 @@
+"""A frame processor that reuses its frame buffers from one frame to the next."""
+import cv2
+import numpy as np
+
+from lanefind import profiling
+from lanefind.config import DEFAULT_CONFIG
+from lanefind.pipeline import fit_lane_lines, frame_geometry, hough_segments, roi_bounding_box, roi_mask
+
+
+class FrameBuffers:
+    """The parameters and the preallocated buffers of every stage, for one frame shape"""
+
+    def __init__(self, imshape, config, crop_to_roi):
+        geometry = frame_geometry(imshape, crop_to_roi, config)
+        self.params = geometry.params
+        self.box = x1, y1, x2, y2 = geometry.box
+        self.scale = geometry.scale
+        self.gray = np.empty((y2 - y1, x2 - x1), dtype=np.uint8)
+        if config.color_filter:
+            self.hls = np.empty((y2 - y1, x2 - x1, 3), dtype=np.uint8)
+            self.color_mask = np.empty_like(self.gray)
+            self.range_mask = np.empty_like(self.gray)
+        self.small = None
+        shape = self.gray.shape
+        if self.scale != 1:
+            self.small = cv2.resize(self.gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+            shape = self.small.shape
+        self.blur_gray = np.empty(shape, dtype=np.uint8)
+        self.edges = np.empty(shape, dtype=np.uint8)
+        self.masked_edges = np.empty(shape, dtype=np.uint8)
+        self.mask = roi_mask(shape, self.edges.dtype.str,
+                             tuple(tuple(map(tuple, polygon.tolist())) for polygon in geometry.vertices))
+
+        self.output = np.empty((imshape[0], imshape[1], 3), dtype=np.uint8)
+        # the lane lines are drawn on a one channel mask, and only the lines of
+        # the previous frame are erased from it again
+        self.line_mask = np.zeros(imshape[:2], dtype=np.uint8)
+        self.drawn_lines = np.full((2, 4), np.nan)
+
+
+class FrameProcessor:
+    """
+    Runs the pipeline of process_image() without allocating frame sized arrays.
+
+    The buffers of every stage are allocated on the first frame of each shape
+    and handed to OpenCV as the `dst` of the stage after that, so frames of a
+    video only allocate the Hough segments and the few small arrays of
+    fit_lane_lines(). The lane lines are not drawn on a blank frame that is
+    then blended in: the output is the dimmed frame, brightened in the color of
+    the lines under a one channel mask of them, which gives the same image.
+
+    The frame returned by process_image() is overwritten by the next call. Copy
+    it to keep it, or to hand it to another thread or process, or pass `out`.
+    The processor is not thread safe: use one per thread or process.
+
+    With `bgr`, the frames are BGR, as cv2.imread() and cv2.VideoCapture give
+    them, and `color` is in the same channel order.
+    """
+
+    def __init__(self, crop_to_roi=False, config=None, color=(255, 0, 0), thickness=10, α=0.8, bgr=False):
+        self.crop_to_roi = crop_to_roi
+        self.config = config or DEFAULT_CONFIG
+        self.color = color
+        self.thickness = thickness
+        self.α = α
+        # frames from cv2.imread() and cv2.VideoCapture are BGR
+        self.bgr = bgr
+        # {frame shape: FrameBuffers}
+        self.buffers = {}
+
+    def __getstate__(self):
+        # the buffers are not worth sending to another process
+        return dict(self.__dict__, buffers={})
+
+    def frame_buffers(self, imshape):
+        """Returns the FrameBuffers for frames of shape `imshape`, allocating them on first use"""
+        buffers = self.buffers.get(imshape)
+        if buffers is None:
+            buffers = self.buffers[imshape] = FrameBuffers(imshape, self.config, self.crop_to_roi)
+        return buffers
+
+    def find_lane_lines(self, image, return_support=False):
+        """Returns the lane lines of `image`, like find_lane_lines()"""
+        with profiling.frame():
+            buffers = self.frame_buffers(image.shape)
+            params = buffers.params
+            x1, y1, x2, y2 = buffers.box
+            with profiling.stage('grayscale'):
+                gray = cv2.cvtColor(image[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY if self.bgr else cv2.COLOR_RGB2GRAY,
+                                    dst=buffers.gray)
+
+            if self.config.color_filter:
+                with profiling.stage('color_filter'):
+                    cv2.cvtColor(image[y1:y2, x1:x2], cv2.COLOR_BGR2HLS if self.bgr else cv2.COLOR_RGB2HLS,
+                                 dst=buffers.hls)
+                    ranges = self.config.color_ranges
+                    cv2.inRange(buffers.hls, *ranges[0], dst=buffers.color_mask)
+                    for low, high in ranges[1:]:
+                        cv2.inRange(buffers.hls, low, high, dst=buffers.range_mask)
+                        cv2.bitwise_or(buffers.color_mask, buffers.range_mask, dst=buffers.color_mask)
+                    cv2.bitwise_and(gray, buffers.color_mask, dst=gray)
+
+            if buffers.small is not None:
+                with profiling.stage('downscale'):
+                    gray = cv2.resize(gray, None, buffers.small, buffers.scale, buffers.scale, cv2.INTER_AREA)
+
+            with profiling.stage('gaussian_blur'):
+                cv2.GaussianBlur(gray, (params.kernel_size, params.kernel_size), 0, dst=buffers.blur_gray)
+
+            with profiling.stage('canny'):
+                cv2.Canny(buffers.blur_gray, params.low_threshold, params.high_threshold, edges=buffers.edges)
+
+            with profiling.stage('region_of_interest'):
+                cv2.bitwise_and(buffers.edges, buffers.mask, dst=buffers.masked_edges)
+                if profiling.active():
+                    profiling.count('edge_pixels', cv2.countNonZero(buffers.masked_edges))
+
+            lines = hough_segments(buffers.masked_edges, params.rho, params.theta, params.threshold,
+                                   params.min_line_length, params.max_line_gap, offset=(x1, y1), scale=buffers.scale,
+                                   detector=self.config.detector)
+
+            with profiling.stage('fit_lane_lines'):
+                return fit_lane_lines(lines, image.shape, return_support=return_support)
+
+    def process_image(self, image, out=None):
+        """
+        Returns `image` with the lane lines drawn on it, like process_image().
+
+        The result is written to `out` if given, else to a buffer of the
+        processor that the next frame of the same shape overwrites.
+        """
+        with profiling.frame():
+            return self.draw_lane_lines(image, self.find_lane_lines(image), out)
+
+    def draw_lane_lines(self, image, two_lines, out=None):
+        """Returns `image` with the lane lines `two_lines` drawn on it, see process_image()"""
+        with profiling.frame():
+            buffers = self.frame_buffers(image.shape)
+
+            with profiling.stage('draw_lines'):
+                drawn = ~np.isnan(buffers.drawn_lines).any(axis=1)
+                for x1, y1, x2, y2 in buffers.drawn_lines[drawn].astype(int):
+                    cv2.line(buffers.line_mask, (x1, y1), (x2, y2), 0, self.thickness)
+                found = ~np.isnan(two_lines).any(axis=1)
+                for x1, y1, x2, y2 in two_lines[found].astype(int):
+                    cv2.line(buffers.line_mask, (x1, y1), (x2, y2), 255, self.thickness)
+                buffers.drawn_lines = two_lines
+
+            with profiling.stage('weighted_img'):
+                out = buffers.output if out is None else out
+                # the same as weighted_img() of the lines drawn on a blank frame:
+                # α * image everywhere, plus the color of the lines under them
+                cv2.convertScaleAbs(image, out, self.α)
+                if found.any():
+                    # only the bounding box of the lines needs the mask
+                    x1, y1, x2, y2 = roi_bounding_box(two_lines[found].reshape(-1, 2, 2).astype(int), image.shape,
+                                                      margin=self.thickness)
+                    box = out[y1:y2, x1:x2]
+                    cv2.add(box, tuple(self.color) + (0,), dst=box, mask=buffers.line_mask[y1:y2, x1:x2])
+            return out
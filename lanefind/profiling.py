@@ -0,0 +1,168 @@
+"""
+Per-stage timing of the lane finding pipeline.
+
+Profiling is off by default. The pipeline marks its stages with
+`with profiling.stage(name):`, and while profiling is off that returns a
+shared do-nothing context manager, which costs well under a microsecond per
+stage. Once enable() is called, every frame gets a record with the wall time
+of each stage in milliseconds (`<stage>_ms`), the number of Hough segments
+(`segments`), and with `track_allocations` the bytes allocated at the peak of
+each stage (`<stage>_bytes`), as traced by tracemalloc.
+
+    profiler = profiling.enable()
+    process_image(image)
+    profiling.disable()
+    profiler.write('profile.csv')
+    profiler.print_summary()
+"""
+import contextlib
+import csv
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+# the percentiles of every summary of the package: the profiler, `lanefind stream` and `lanefind serve`
+PERCENTILES = (50, 95, 99)
+
+_null_context = contextlib.nullcontext()
+_active = None
+_started_tracemalloc = False
+
+
+class Profiler:
+    """Collects one record of stage timings per frame"""
+
+    def __init__(self, track_allocations=False):
+        self.track_allocations = track_allocations
+        # the records of the finished frames, in order
+        self.frames = []
+        self.record = None
+
+    @contextlib.contextmanager
+    def frame(self):
+        """Opens the record of a frame. Nested frames record into the outermost one"""
+        if self.record is not None:
+            yield self.record
+            return
+        self.record = record = {'frame': len(self.frames)}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['total_ms'] = (time.perf_counter() - start) * 1e3
+            self.record = None
+            self.frames.append(record)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Times a stage of the current frame. Nothing is recorded outside of a frame"""
+        record = self.record
+        if record is None:
+            yield
+            return
+        if self.track_allocations:
+            allocated = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # a stage that runs several times in a frame adds up
+            record[name + '_ms'] = record.get(name + '_ms', 0) + (time.perf_counter() - start) * 1e3
+            if self.track_allocations:
+                peak = tracemalloc.get_traced_memory()[1] - allocated
+                record[name + '_bytes'] = record.get(name + '_bytes', 0) + peak
+
+    def count(self, name, value):
+        """Adds `value` to the `name` counter of the current frame"""
+        if self.record is not None:
+            self.record[name] = self.record.get(name, 0) + value
+
+    def add_frame(self, record):
+        """Adds the record of a frame profiled in another process"""
+        record = dict(record, frame=len(self.frames))
+        self.frames.append(record)
+
+    def columns(self):
+        """Returns the column names of the records, in the order they first appear"""
+        columns = {}
+        for record in self.frames:
+            columns.update(dict.fromkeys(record))
+        return list(columns)
+
+    def summary(self):
+        """Returns {column: {'p50': ..., 'p95': ..., 'p99': ..., 'mean': ...}} over all frames"""
+        summary = {}
+        for column in self.columns():
+            if column == 'frame':
+                continue
+            values = np.array([record.get(column, 0) for record in self.frames], dtype=np.float64)
+            summary[column] = percentile_summary(values)
+            summary[column]['mean'] = float(values.mean())
+        return summary
+
+    def print_summary(self):
+        print('{} frames profiled'.format(len(self.frames)))
+        print('{:<24}'.format('') + ''.join('{:>12}'.format('p{}'.format(p)) for p in PERCENTILES))
+        for column, percentiles in self.summary().items():
+            print('{:<24}'.format(column) + ''.join('{:>12.3f}'.format(percentiles['p{}'.format(p)])
+                                                    for p in PERCENTILES))
+
+    def write(self, path):
+        """Writes the frame records to `path`, as JSON with the summary if it ends in .json, else as CSV"""
+        with open(path, 'w', newline='') as output:
+            if path.endswith('.json'):
+                json.dump({'frames': self.frames, 'summary': self.summary()}, output, indent=1)
+            else:
+                writer = csv.DictWriter(output, self.columns(), restval=0)
+                writer.writeheader()
+                writer.writerows(self.frames)
+
+
+def percentile_summary(values):
+    """Returns {'p50': ..., 'p95': ..., 'p99': ...} of `values`, all 0 when there are none"""
+    percentiles = np.percentile(values, PERCENTILES).tolist() if len(values) else [0.] * len(PERCENTILES)
+    return dict(zip(['p{}'.format(p) for p in PERCENTILES], percentiles))
+
+
+def enable(track_allocations=False):
+    """Starts profiling the pipeline in this process and returns the Profiler"""
+    global _active, _started_tracemalloc
+    if track_allocations and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracemalloc = True
+    _active = Profiler(track_allocations)
+    return _active
+
+
+def disable():
+    """Stops profiling, and returns the Profiler that was active"""
+    global _active, _started_tracemalloc
+    profiler, _active = _active, None
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+    return profiler
+
+
+def active():
+    """Returns the active Profiler, or None while profiling is off"""
+    return _active
+
+
+def frame():
+    """Opens the record of a frame, see Profiler.frame()"""
+    return _null_context if _active is None else _active.frame()
+
+
+def stage(name):
+    """Times a stage of the current frame, see Profiler.stage()"""
+    return _null_context if _active is None else _active.stage(name)
+
+
+def count(name, value):
+    """Adds to a counter of the current frame, see Profiler.count()"""
+    if _active is not None:
+        _active.count(name, value)
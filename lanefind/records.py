@@ -0,0 +1,179 @@
+"""
+The lane lines of every frame as compact records, without rendering or encoding.
+
+Each frame gives one LANE_RECORD: its index and time, and for the left and
+the right line the slope and intercept of y = slope * x + intercept, the end
+points, a confidence and the number of Hough segments it was fitted to. A
+missing line has NaN geometry, confidence 0 and 0 segments.
+
+    lanefind lanes drive.mp4 drive.jsonl
+    lanefind lanes drive.mp4 drive.npy
+    lanefind lanes drive.frames/ drive.npy    (a FrameStore, see lanefind.framestore)
+
+A .jsonl file gets one JSON object per line, missing values as null. A .npy
+file holds a structured array of LANE_RECORD, for np.load(). Both are
+written as the frames come, so memory does not grow with the video.
+"""
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from lanefind.adaptive import AdaptiveLaneFinder
+from lanefind.framestore import FrameStore
+from lanefind.pipeline import left_right_order
+from lanefind.processor import FrameProcessor
+from lanefind.video import read_video, video_fps
+
+LANE_SIDE = np.dtype([
+    ('slope', np.float32), ('intercept', np.float32),
+    ('x1', np.float32), ('y1', np.float32), ('x2', np.float32), ('y2', np.float32),
+    ('confidence', np.float32), ('segments', np.int32)])
+
+LANE_RECORD = np.dtype([('frame', np.int64), ('time', np.float64), ('left', LANE_SIDE), ('right', LANE_SIDE)])
+
+
+def lane_record(two_lines, counts, coverage, frame=0, time=0.):
+    """
+    Returns the LANE_RECORD of the output of fit_lane_lines(..., return_support=True).
+
+    The confidence of a line is the fraction of its height covered by its
+    segments: close to 1 for a solid line, lower for a dashed or faint one.
+    """
+    record = np.zeros((), dtype=LANE_RECORD)
+    record['frame'] = frame
+    record['time'] = time
+    for name, row in zip(('left', 'right'), left_right_order(two_lines)):
+        side = record[name]
+        side['segments'] = counts[row]
+        x1, y1, x2, y2 = two_lines[row]
+        if np.isnan(x1):
+            side[['slope', 'intercept', 'x1', 'y1', 'x2', 'y2']] = (np.nan,) * 6
+            continue
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (y2 - y1) / (x2 - x1)
+        side[['slope', 'intercept', 'x1', 'y1', 'x2', 'y2']] = slope, y1 - slope * x1, x1, y1, x2, y2
+        side['confidence'] = coverage[row]
+    return record
+
+
+def record_json(record):
+    """Returns a LANE_RECORD as a dict for json.dumps(), NaN as None"""
+    def value(item):
+        item = item.item()
+        if isinstance(item, float):
+            # float32 values, more digits would only be noise
+            return round(item, 4) if np.isfinite(item) else None
+        return item
+    return {
+        'frame': int(record['frame']),
+        'time': float(record['time']),
+        'left': {field: value(record['left'][field]) for field in LANE_SIDE.names},
+        'right': {field: value(record['right'][field]) for field in LANE_SIDE.names},
+    }
+
+
+class LaneRecordWriter:
+    """
+    Writes LANE_RECORDs to a .jsonl or a .npy file, one at a time.
+
+    Like the image files of process_image_file(), the output only appears
+    under its name once the writer is closed.
+    """
+
+    def __init__(self, path):
+        if not path.endswith(('.jsonl', '.npy')):
+            raise ValueError('lane records are written to .jsonl or .npy files, not ' + path)
+        self.path = path
+        self.partial_path = os.path.join(os.path.dirname(path), '.partial-' + os.path.basename(path))
+        self.count = 0
+        if path.endswith('.jsonl'):
+            self.file = open(self.partial_path, 'w')
+        else:
+            # the .npy header holds the record count, the records go to a file of
+            # their own until the count is known
+            self.file = open(self.partial_path + '.records', 'wb')
+
+    def write(self, record):
+        if self.path.endswith('.jsonl'):
+            self.file.write(json.dumps(record_json(record)) + '\n')
+        else:
+            self.file.write(record.tobytes())
+        self.count += 1
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.close()
+        if self.path.endswith('.npy'):
+            with open(self.partial_path, 'wb') as output, open(self.partial_path + '.records', 'rb') as records:
+                np.lib.format.write_array_header_1_0(output, {
+                    'descr': np.lib.format.dtype_to_descr(LANE_RECORD), 'fortran_order': False,
+                    'shape': (self.count,)})
+                shutil.copyfileobj(records, output)
+            os.remove(self.partial_path + '.records')
+        os.replace(self.partial_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            # do not leave a partial output behind
+            self.file.close()
+            for path in (self.partial_path, self.partial_path + '.records'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def write_records(lane_lines, output, fps=0.):
+    """
+    Writes a LANE_RECORD for each (two_lines, counts, coverage) of `lane_lines`,
+    the output of find_lane_lines(..., return_support=True) for every frame,
+    to the .jsonl or .npy file `output`.
+
+    The time of a record is its frame index over `fps`, or 0 without one.
+    Returns the number of frames.
+    """
+    with LaneRecordWriter(output) as writer:
+        for index, (two_lines, counts, coverage) in enumerate(lane_lines):
+            writer.write(lane_record(two_lines, counts, coverage, index, index / fps if fps else 0.))
+    return writer.count
+
+
+def record_frames(frames, output, fps=0., crop_to_roi=False, config=None, bgr=False):
+    """Writes the LANE_RECORD of each of `frames` to `output`, see write_records()"""
+    processor = FrameProcessor(crop_to_roi, config, bgr=bgr)
+    return write_records((processor.find_lane_lines(frame, return_support=True) for frame in frames), output, fps)
+
+
+def record_video(path, output, crop_to_roi=False, config=None, budget=None):
+    """
+    Writes the lane records of every frame of `path` to `output`.
+
+    `path` is a video file, or the directory of a FrameStore. The frames of a
+    video are decoded by OpenCV into one reused array, those of a store are
+    read from its cached blurred frames, and they are never drawn on or
+    encoded. With `budget`, an AdaptiveLaneFinder only runs the detection on
+    some of the frames, and the records of the others have 0 segments.
+    Returns the frames/sec, decoding included.
+    """
+    start = time.perf_counter()
+    store = FrameStore(path) if os.path.isdir(path) else None
+    if budget is not None:
+        finder = AdaptiveLaneFinder(budget, crop_to_roi=crop_to_roi, config=config, bgr=store is None)
+        frames, fps = (store, store.fps) if store is not None else (read_video(path), video_fps(path))
+        frame_count = write_records(finder.lane_lines(frames, return_support=True), output, fps)
+    elif store is not None:
+        frame_count = write_records(store.lane_lines(crop_to_roi, config, return_support=True), output, store.fps)
+    else:
+        frame_count = record_frames(read_video(path), output, video_fps(path), crop_to_roi, config, bgr=True)
+    frames_per_second = frame_count / (time.perf_counter() - start)
+    print('{}: {} frames, {:.1f} frames/sec'.format(output, frame_count, frames_per_second))
+    if budget is not None:
+        print(finder.detection_summary())
+    return frames_per_second
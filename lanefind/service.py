@@ -0,0 +1,318 @@
+"""
+A local lane finding service over HTTP, for other processes to call.
+
+    lanefind serve [--port 8080] [--unix PATH] [--workers N] [--max-batch 8]
+
+    POST /lanes     the body is a JPEG or PNG image, or a raw RGB frame with
+                    `Content-Type: application/octet-stream` and
+                    `?width=W&height=H`. Returns {"width", "height", "lines":
+                    {"left": [x1, y1, x2, y2] or null, "right": ...}}, and
+                    with `?annotate=1` also "image", the frame with the lines
+                    drawn as a base64 JPEG.
+    GET /metrics    request counts, queue depth, batch sizes and latency percentiles
+    GET /health     200 while the service is up
+
+Requests go to a bounded queue. A batcher takes them off the queue in
+micro-batches, up to `max_batch` requests that arrived within
+`batch_window` seconds of each other, and runs each batch on a pool of
+`workers` threads (OpenCV releases the GIL). The waiting requests are
+shared out between the idle workers, so a burst runs on all of them at
+once; the batches only grow past a request while every other worker is
+busy. Once the queue is full new requests get a 503 with
+`Retry-After`, so a client that sends too much slows down instead of piling
+up memory in the service.
+"""
+import asyncio
+import base64
+import collections
+import concurrent.futures
+import json
+import math
+import os
+import threading
+import time
+import urllib.parse
+
+import cv2
+import numpy as np
+
+from lanefind.pipeline import left_right_lines
+from lanefind.processor import FrameProcessor
+from lanefind.profiling import percentile_summary
+
+# the reason phrases of the statuses the service answers with
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class RequestError(Exception):
+    """A request the service cannot answer, with the HTTP status to answer it with"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class FrameRequest:
+    """A frame waiting in the queue for its batch"""
+
+    def __init__(self, body, content_type, query, future):
+        self.body = body
+        self.content_type = content_type
+        self.query = query
+        self.future = future
+        self.enqueued = time.perf_counter()
+        self.started = None
+
+
+def decode_frame(body, content_type, query):
+    """Returns the RGB frame of a request body"""
+    if content_type == 'application/octet-stream':
+        try:
+            width, height = int(query['width'][0]), int(query['height'][0])
+        except (KeyError, ValueError):
+            raise RequestError(400, 'raw frames need the width and height query parameters')
+        if len(body) != width * height * 3:
+            raise RequestError(400, 'a {}x{} RGB frame is {} bytes, got {}'.format(
+                width, height, width * height * 3, len(body)))
+        return np.frombuffer(body, dtype=np.uint8).reshape(height, width, 3)
+    image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise RequestError(400, 'cannot decode the image, send a JPEG, a PNG or a raw frame')
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def lines_json(two_lines):
+    """Returns the lines of fit_lane_lines() as {"left": [x1, y1, x2, y2] or None, "right": ...}"""
+    left, right = left_right_lines(two_lines)
+    return {side: None if np.isnan(line).any() else line.round(1).tolist()
+            for side, line in (('left', left), ('right', right))}
+
+
+class Metrics:
+    """Request counters, and the latencies of the last `window` requests"""
+
+    def __init__(self, window=10000):
+        self.started = time.time()
+        self.requests = 0
+        self.rejected = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.latency_ms = collections.deque(maxlen=window)
+        self.queue_ms = collections.deque(maxlen=window)
+        # the busy workers as each batch starts, that one included
+        self.busy_workers = collections.deque(maxlen=window)
+
+    def summary(self):
+        return {
+            'uptime_s': time.time() - self.started,
+            'requests': self.requests,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'batches': self.batches,
+            'batched_requests': self.batched_requests,
+            'mean_batch_size': self.batched_requests / self.batches if self.batches else 0.,
+            'mean_busy_workers': float(np.mean(self.busy_workers)) if self.busy_workers else 0.,
+            'max_busy_workers': max(self.busy_workers, default=0),
+            'latency_ms': percentile_summary(self.latency_ms),
+            'queue_ms': percentile_summary(self.queue_ms),
+        }
+
+
+class LaneService:
+    """
+    Finds the lane lines of the frames posted to it, in micro-batches on a thread pool.
+
+    `queue_size` requests can wait for a worker, more get a 503. `crop_to_roi`
+    and `config` are those of process_image(). `workers` defaults to one per core.
+    """
+
+    def __init__(self, workers=None, max_batch=8, batch_window=0.002, queue_size=64, max_body=64 * 2 ** 20,
+                 crop_to_roi=False, config=None):
+        self.workers = workers or os.cpu_count()
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.queue_size = queue_size
+        self.max_body = max_body
+        self.crop_to_roi = crop_to_roi
+        self.config = config
+        self.metrics = Metrics()
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix='lanefind')
+        # a FrameProcessor per worker thread, so each reuses its own buffers
+        self.local = threading.local()
+        self.queue = None
+        # the workers running a batch
+        self.busy_workers = 0
+
+    def processor(self):
+        """Returns the FrameProcessor of the calling worker thread"""
+        processor = getattr(self.local, 'processor', None)
+        if processor is None:
+            processor = self.local.processor = FrameProcessor(self.crop_to_roi, self.config)
+        return processor
+
+    def process_request(self, request):
+        """Returns the JSON result of a FrameRequest, runs on a worker thread"""
+        image = decode_frame(request.body, request.content_type, request.query)
+        processor = self.processor()
+        two_lines = processor.find_lane_lines(image)
+        result = {'width': image.shape[1], 'height': image.shape[0], 'lines': lines_json(two_lines)}
+        if request.query.get('annotate', ['0'])[0] not in ('0', 'false', ''):
+            annotated = processor.draw_lane_lines(image, two_lines)
+            _, jpeg = cv2.imencode('.jpg', cv2.cvtColor(annotated, cv2.COLOR_RGB2BGR))
+            result['image'] = base64.b64encode(jpeg.tobytes()).decode('ascii')
+        return result
+
+    def process_batch(self, batch):
+        """Returns the result, or the exception, of every FrameRequest of `batch`"""
+        results = []
+        for request in batch:
+            request.started = time.perf_counter()
+            try:
+                results.append(self.process_request(request))
+            except Exception as error:
+                results.append(error)
+        return results
+
+    async def find_lanes(self, body, content_type, query):
+        """Queues a frame and returns its JSON result, raises RequestError(503) when the queue is full"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait(FrameRequest(body, content_type, query, future))
+        except asyncio.QueueFull:
+            self.metrics.rejected += 1
+            raise RequestError(503, 'the service is busy, try again')
+        return await future
+
+    async def batcher(self):
+        """
+        Takes micro-batches off the queue and runs them on the workers, one batch per idle worker.
+
+        The waiting requests are shared out between the idle workers: a batch
+        only takes its share of the queue, and only the last idle worker waits
+        `batch_window` for more requests, up to `max_batch`.
+        """
+        loop = asyncio.get_running_loop()
+        idle_workers = asyncio.Semaphore(self.workers)
+        while True:
+            await idle_workers.acquire()
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            # the workers that are idle, this one included
+            idle = self.workers - self.busy_workers
+            while len(batch) < self.max_batch:
+                if self.queue.empty():
+                    # another idle worker takes the next request as soon as it comes
+                    timeout = deadline - loop.time() if idle == 1 else 0
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                elif len(batch) < math.ceil((len(batch) + self.queue.qsize()) / idle):
+                    batch.append(self.queue.get_nowait())
+                else:
+                    break
+            self.busy_workers += 1
+            self.metrics.busy_workers.append(self.busy_workers)
+            self.metrics.batches += 1
+            self.metrics.batched_requests += len(batch)
+            done = loop.run_in_executor(self.executor, self.process_batch, batch)
+            done.add_done_callback(lambda done, batch=batch: self.finish_batch(batch, done, idle_workers))
+
+    def finish_batch(self, batch, done, idle_workers):
+        self.busy_workers -= 1
+        idle_workers.release()
+        finished = time.perf_counter()
+        results = done.result() if done.exception() is None else [done.exception()] * len(batch)
+        for request, result in zip(batch, results):
+            self.metrics.latency_ms.append((finished - request.enqueued) * 1e3)
+            self.metrics.queue_ms.append(((request.started or finished) - request.enqueued) * 1e3)
+            if request.future.done():
+                # the client went away
+                continue
+            if isinstance(result, Exception):
+                request.future.set_exception(result)
+            else:
+                request.future.set_result(result)
+
+    async def respond(self, method, target, headers, body):
+        """Returns the (status, JSON result) of a request"""
+        url = urllib.parse.urlsplit(target)
+        if url.path == '/lanes':
+            if method != 'POST':
+                raise RequestError(405, 'POST a frame to /lanes')
+            content_type = headers.get('content-type', '').split(';')[0].strip()
+            return 200, await self.find_lanes(body, content_type, urllib.parse.parse_qs(url.query))
+        if url.path in ('/metrics', '/health'):
+            if method != 'GET':
+                raise RequestError(405, 'GET ' + url.path)
+            if url.path == '/health':
+                return 200, {'status': 'ok'}
+            return 200, dict(self.metrics.summary(), queued=self.queue.qsize(), queue_size=self.queue_size,
+                             workers=self.workers, max_batch=self.max_batch)
+        raise RequestError(404, 'no such path ' + url.path)
+
+    async def handle_connection(self, reader, writer):
+        """Answers the requests of a connection, which is kept alive until the client closes it"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode('latin-1')
+                    if line in ('\r\n', '\n', ''):
+                        break
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                if length > self.max_body:
+                    status, result, keep_alive = 413, {'error': 'the body is over {} bytes'.format(self.max_body)}, False
+                else:
+                    body = await reader.readexactly(length)
+                    self.metrics.requests += 1
+                    try:
+                        status, result = await self.respond(method, target, headers, body)
+                    except RequestError as error:
+                        status, result = error.status, {'error': str(error)}
+                    except Exception as error:
+                        self.metrics.errors += 1
+                        status, result = 500, {'error': repr(error)}
+                payload = json.dumps(result).encode()
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n{}{}\r\n'.format(
+                    status, REASONS[status], len(payload), 'Retry-After: 1\r\n' if status == 503 else '',
+                    'Connection: keep-alive\r\n' if keep_alive else 'Connection: close\r\n').encode('latin-1') + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            # a client that hung up or does not speak HTTP
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080, unix_path=None, ready=None):
+        """
+        Serves on `host`:`port`, or on the unix socket `unix_path`, until cancelled.
+        `ready` is called with the server once it listens.
+        """
+        self.queue = asyncio.Queue(self.queue_size)
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle_connection, unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        batcher = asyncio.ensure_future(self.batcher())
+        if ready is not None:
+            ready(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,195 @@
+"""
+Live lane finding on a camera or a raw frame pipe, where latency matters more than throughput.
+
+    lanefind stream 0                                          (the first camera, /dev/video0)
+    lanefind stream /dev/video2 --lanes lanes.jsonl
+    ffmpeg -i drive.mp4 -f rawvideo -pix_fmt rgb24 - | lanefind stream - --width 1280 --height 720
+
+The frames are read on the calling thread, as fast as the source gives them,
+and handed to a worker thread through a single slot. The worker always takes
+the newest frame: a frame still in the slot when the next one is read is
+dropped, so when the pipeline is slower than the source the results skip
+frames instead of falling further and further behind. The latency of a
+result, from the moment its frame was read to the moment the pipeline is
+done with it, stays under about two frame times of the pipeline.
+
+Three frame buffers go around between the reader, the slot and the worker,
+so no frame is allocated once they are.
+"""
+import collections
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from lanefind.profiling import PERCENTILES, percentile_summary
+
+# buffers of a stream: one being read, one in the slot, one being processed
+BUFFERS = 3
+
+
+class RawFrameReader:
+    """
+    Reads raw RGB frames of `width` x `height` (rgb24, as ffmpeg's rawvideo
+    gives them) from the binary file `stream`, e.g. sys.stdin.buffer.
+    """
+
+    bgr = False
+
+    def __init__(self, stream, width, height):
+        self.stream = stream
+        self.shape = (height, width, 3)
+
+    def read(self, out=None):
+        """Returns the next frame, read into `out` if given, or None at the end of the stream"""
+        frame = np.empty(self.shape, dtype=np.uint8) if out is None else out
+        view = memoryview(frame).cast('B')
+        read = 0
+        while read < len(view):
+            count = self.stream.readinto(view[read:])
+            if not count:
+                # the end of the stream, a partial frame is not a frame
+                return None
+            read += count
+        return frame
+
+    def close(self):
+        self.stream.close()
+
+
+class CaptureReader:
+    """
+    Reads the BGR frames of cv2.VideoCapture(`source`): a camera index, a
+    device like /dev/video0, a video file or a stream URL.
+    """
+
+    bgr = True
+
+    def __init__(self, source):
+        self.capture = cv2.VideoCapture(source)
+        if not self.capture.isOpened():
+            raise IOError('cannot open video source {}'.format(source))
+        # a camera queues a few frames by default, which only adds latency
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    def read(self, out=None):
+        """Returns the next frame, read into `out` if given, or None at the end of the video"""
+        ok, frame = self.capture.read(out)
+        return frame if ok else None
+
+    def close(self):
+        self.capture.release()
+
+
+class LatestFrameStream:
+    """
+    Runs `frame_function` on a worker thread, always on the newest frame of
+    a reader, see the module docstring.
+
+    Keeps the capture to result latency and the time of `frame_function` of
+    the last `window` processed frames, and counts the frames read, processed
+    and dropped.
+    """
+
+    def __init__(self, frame_function, window=10000):
+        self.frame_function = frame_function
+        self.read = 0
+        self.processed = 0
+        self.dropped = 0
+        self.latency_ms = collections.deque(maxlen=window)
+        self.process_ms = collections.deque(maxlen=window)
+        self.started = None
+        self.elapsed = 0.
+
+    def run(self, reader, on_result=None, max_frames=None):
+        """
+        Reads the frames of `reader` until it ends, `max_frames` frames are
+        read or the worker fails, and returns once the worker is done.
+
+        `on_result(index, captured, result)` is called on the worker thread
+        with the index of the frame, the time.perf_counter() at which it was
+        read and the return value of `frame_function`, before the frame
+        buffer goes back to the reader.
+        """
+        condition = threading.Condition()
+        # the buffers the reader can read into, None until the reader allocated them
+        free = [None] * BUFFERS
+        # (index, captured, frame) of the newest frame the worker has not taken
+        slot = None
+        done = False
+        errors = []
+
+        def work():
+            nonlocal slot
+            while True:
+                with condition:
+                    while slot is None and not done:
+                        condition.wait()
+                    if slot is None:
+                        return
+                    (index, captured, frame), slot = slot, None
+                try:
+                    start = time.perf_counter()
+                    result = self.frame_function(frame)
+                    finished = time.perf_counter()
+                    self.process_ms.append((finished - start) * 1e3)
+                    self.latency_ms.append((finished - captured) * 1e3)
+                    self.processed += 1
+                    if on_result is not None:
+                        on_result(index, captured, result)
+                except Exception as error:
+                    errors.append(error)
+                    return
+                finally:
+                    with condition:
+                        free.append(frame)
+
+        worker = threading.Thread(target=work, daemon=True)
+        worker.start()
+        self.started = time.perf_counter()
+        try:
+            while not errors and (max_frames is None or self.read < max_frames):
+                with condition:
+                    buffer = free.pop()
+                frame = reader.read(buffer)
+                if frame is None:
+                    break
+                captured = time.perf_counter()
+                with condition:
+                    if slot is not None:
+                        # the worker is still busy with an older frame, this one is stale
+                        free.append(slot[2])
+                        self.dropped += 1
+                    slot = (self.read, captured, frame)
+                    condition.notify()
+                self.read += 1
+        finally:
+            with condition:
+                done = True
+                condition.notify()
+            worker.join()
+            self.elapsed = time.perf_counter() - self.started
+        if errors:
+            raise errors[0]
+
+    def summary(self):
+        """Returns the frame counts, the frames/sec read and processed, and the latency percentiles"""
+        return {
+            'read': self.read,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'read_fps': self.read / self.elapsed if self.elapsed else 0.,
+            'processed_fps': self.processed / self.elapsed if self.elapsed else 0.,
+            'latency_ms': percentile_summary(self.latency_ms),
+            'process_ms': percentile_summary(self.process_ms),
+        }
+
+    def print_summary(self, file=None):
+        summary = self.summary()
+        print('{} frames read ({:.1f} frames/sec), {} processed ({:.1f} frames/sec), {} dropped'.format(
+            summary['read'], summary['read_fps'], summary['processed'], summary['processed_fps'],
+            summary['dropped']), file=file)
+        for name in ('latency_ms', 'process_ms'):
+            print('{:<12}'.format(name) + ''.join('  p{} {:>8.2f}'.format(p, summary[name]['p{}'.format(p)])
+                                                  for p in PERCENTILES), file=file)
@@ -0,0 +1,242 @@
+"""
+Parameter sweeps of the pipeline, over the images of a directory or the frames of a FrameStore.
+
+    lanefind sweep test_images/ --output sweep.csv
+    lanefind sweep drive.frames/ --space space.json --random 500
+
+A search space maps PipelineConfig parameters to the values to try, see
+SEARCH_SPACE: `kernel_size`, `low_threshold`, `high_threshold`, `rho`,
+`theta`, `threshold`, `min_line_length`, `max_line_gap` (the Hough ones as
+fractions of the frame height, like PipelineConfig) and `roi`. A grid sweep
+tries every combination, a random one `count` of them.
+
+Trials that share the blur kernel and the Canny thresholds are run together
+in one task on a pool of processes: the grayscale, blurred and Canny frames
+are computed once per frame for the whole group, the region of interest once
+per polygon, and only Hough and the line fit run for every trial. On a
+FrameStore, the blurred frames come from its cache (FrameStore.blurred_gray()),
+computed once per blur kernel and kept for the next sweeps.
+
+Every trial gets an error score, lower is better. It is the mean distance of
+its lane lines from the consensus of all trials (the median line of each
+side over the trials), for a sequence of frames plus their jitter from one
+frame to the next, as a fraction of the frame height and measured at the
+bottom of the frame and at the top of the region of interest. A missing line
+counts as an error of 1. The report ranks the trials by error, then by time.
+"""
+import collections
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+import warnings
+
+import cv2
+import numpy as np
+
+from lanefind.config import DEFAULT_CONFIG, PipelineConfig
+from lanefind.framestore import FrameStore
+from lanefind.pipeline import (canny, fit_lane_lines, gaussian_blur, grayscale, lane_line_errors, left_right_lines,
+                               region_of_interest)
+
+# the default search space, around the parameters tuned on the test images
+SEARCH_SPACE = {
+    'kernel_size': [3, 5, 7],
+    'low_threshold': [30, 50, 70],
+    'high_threshold': [100, 150, 200],
+    'rho': [1 / 540, 2 / 540],
+    'theta': [np.pi / 180],
+    'threshold': [10 / 540, 15 / 540, 25 / 540],
+    'min_line_length': [20 / 540, 40 / 540, 60 / 540],
+    'max_line_gap': [10 / 540, 20 / 540, 40 / 540],
+    'roi': [DEFAULT_CONFIG.roi,
+            ((0.1, 1.), (0.45, 0.6), (0.55, 0.6), (0.95, 1.))],
+}
+
+# parameters of the trials that share the grayscale, blurred and Canny frames
+PREFIX = ('kernel_size', 'low_threshold', 'high_threshold')
+
+# the frames of the sweep, set in every worker process
+_frames = None
+
+
+def grid_trials(space):
+    """Returns every combination of the values of `space`, as PipelineConfig keyword dicts"""
+    names = list(space)
+    return [trial for trial in (dict(zip(names, values)) for values in itertools.product(*space.values()))
+            if trial.get('low_threshold', 0) < trial.get('high_threshold', 256)]
+
+
+def random_trials(space, count, seed=0):
+    """Returns `count` different random combinations of the values of `space`"""
+    rng = random.Random(seed)
+    trials = {}
+    # the size of grid_trials(space), without building it: the product of the value counts,
+    # with the Canny thresholds counted as the pairs that keep low below high
+    thresholds = ('low_threshold', 'high_threshold')
+    possible = sum(low < high for low in space.get('low_threshold', [0]) for high in space.get('high_threshold', [256]))
+    for name, values in space.items():
+        if name not in thresholds:
+            possible *= len(values)
+    while len(trials) < min(count, possible):
+        trial = {name: rng.choice(values) for name, values in space.items()}
+        if trial.get('low_threshold', 0) < trial.get('high_threshold', 256):
+            trials[json.dumps(trial, sort_keys=True)] = trial
+    return list(trials.values())
+
+
+def run_group(task):
+    """
+    Runs the trials of a group that shares PREFIX on all frames.
+    Returns [(trial index, (frame count, 2, 4) left and right lines, seconds)]
+    """
+    prefix, trials = task
+    config = PipelineConfig(**prefix)
+    # a frame store starts from its cached blurred frames, see run_sweep()
+    blurs = _frames.blurred_gray(config=config) if isinstance(_frames, FrameStore) else None
+    shared_time = 0.
+    lines = {index: [] for index, _ in trials}
+    times = dict.fromkeys(lines, 0.)
+    for frame_index, frame in enumerate(_frames):
+        start = time.perf_counter()
+        blur_gray = gaussian_blur(grayscale(frame), config.kernel_size) if blurs is None else blurs[frame_index]
+        edges = canny(blur_gray, config.low_threshold, config.high_threshold)
+        shared_time += time.perf_counter() - start
+        # the masked edges of each region of interest
+        masked = {}
+        for index, trial in trials:
+            start = time.perf_counter()
+            params = PipelineConfig(**trial).pixels(frame.shape)
+            roi = params.vertices.tobytes()
+            if roi not in masked:
+                masked[roi] = region_of_interest(edges, params.vertices)
+                shared_time += time.perf_counter() - start
+                start = time.perf_counter()
+            segments = cv2.HoughLinesP(masked[roi], params.rho, params.theta, params.threshold, np.array([]),
+                                       minLineLength=params.min_line_length, maxLineGap=params.max_line_gap)
+            lines[index].append(left_right_lines(fit_lane_lines(segments, frame.shape)))
+            times[index] += time.perf_counter() - start
+    # every trial pays for its share of the stages it has in common with the group
+    return [(index, np.array(lines[index]), times[index] + shared_time / len(trials)) for index, _ in trials]
+
+
+def _set_frames(frames):
+    global _frames
+    # a frame store is opened again in every worker process, so that its frames are mapped and not copied
+    _frames = FrameStore(frames) if isinstance(frames, str) else frames
+
+
+def run_sweep(frames, trials, workers=None, sequence=False):
+    """
+    Runs every trial, a dict of PipelineConfig keywords, on `frames`, a list
+    of RGB frames of the same shape or a FrameStore, on a pool of `workers`
+    processes.
+
+    The groups of a FrameStore start from its cached blurred frames, one
+    cache per blur kernel, and only run Canny onwards. The missing caches are
+    computed before the pool starts, so no two workers compute the same one.
+
+    With `sequence`, the frames are consecutive frames of a video, and their
+    jitter counts in the error. Returns a result dict per trial, best first.
+    """
+    groups = collections.defaultdict(list)
+    for index, trial in enumerate(trials):
+        groups[tuple(trial.get(name, getattr(DEFAULT_CONFIG, name)) for name in PREFIX)].append((index, trial))
+    tasks = [(dict(zip(PREFIX, prefix)), group) for prefix, group in groups.items()]
+
+    start = time.perf_counter()
+    if isinstance(frames, FrameStore):
+        for kernel_size in sorted({prefix['kernel_size'] for prefix, _ in tasks}):
+            frames.blurred_gray(config=PipelineConfig(kernel_size=kernel_size))
+    results = [None] * len(trials)
+    workers = workers or multiprocessing.cpu_count()
+    if workers == 1:
+        _set_frames(frames)
+        done = map(run_group, tasks)
+    else:
+        pool = multiprocessing.Pool(workers, _set_frames,
+                                    (frames.directory if isinstance(frames, FrameStore) else frames,))
+        done = pool.imap_unordered(run_group, tasks)
+    try:
+        for group_results in done:
+            for index, lines, seconds in group_results:
+                results[index] = (lines, seconds)
+    finally:
+        if workers != 1:
+            pool.terminate()
+    elapsed = time.perf_counter() - start
+
+    height = frames[0].shape[0]
+    top_y = height * min(y for _, y in DEFAULT_CONFIG.roi)
+    all_lines = np.array([lines for lines, _ in results])
+    with warnings.catch_warnings():
+        # a side no trial finds has no consensus, and every trial is 1 away from it
+        warnings.simplefilter('ignore', RuntimeWarning)
+        consensus = np.nanmedian(all_lines, axis=0)
+    report = []
+    for trial, (lines, seconds) in zip(trials, results):
+        errors = lane_line_errors(lines, consensus, height, top_y)
+        result = {
+            'consensus_error': float(errors.mean()),
+            'found': float((~np.isnan(lines).any(axis=2)).all(axis=1).mean()),
+            'ms_per_frame': seconds / len(frames) * 1e3,
+        }
+        result['error'] = result['consensus_error']
+        if sequence and len(frames) > 1:
+            result['jitter'] = float(lane_line_errors(lines[1:], lines[:-1], height, top_y).mean())
+            result['error'] += result['jitter']
+        result.update(trial)
+        report.append(result)
+    report.sort(key=lambda result: (round(result['error'], 4), result['ms_per_frame']))
+    for rank, result in enumerate(report, 1):
+        result['rank'] = rank
+    print('{} trials on {} frames in {:.1f} s with {} workers'.format(len(trials), len(frames), elapsed, workers))
+    return report
+
+
+def load_frames(path):
+    """
+    Returns the RGB frames of an image directory, or the FrameStore of a store
+    directory, and whether they are a sequence
+    """
+    if os.path.exists(os.path.join(path, 'index.json')):
+        return FrameStore(path), True
+    frames = []
+    for file_name in sorted(os.listdir(path)):
+        image = cv2.imread(os.path.join(path, file_name), cv2.IMREAD_COLOR)
+        if image is not None:
+            frames.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    if not frames:
+        raise IOError('no images in ' + path)
+    if len({frame.shape for frame in frames}) > 1:
+        raise IOError('the images of {} have different sizes'.format(path))
+    return frames, False
+
+
+def write_report(report, path):
+    """Writes the ranked results to `path`, as JSON if it ends in .json, else as CSV"""
+    with open(path, 'w', newline='') as output:
+        if path.endswith('.json'):
+            json.dump(report, output, indent=1)
+        else:
+            columns = ['rank', 'error', 'consensus_error', 'jitter', 'found', 'ms_per_frame'] + \
+                [name for name in report[0] if name not in ('rank', 'error', 'consensus_error', 'jitter', 'found',
+                                                            'ms_per_frame')]
+            writer = csv.DictWriter(output, columns, restval='', extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(report)
+
+
+def print_report(report, top=10):
+    """Prints the `top` trials of the report"""
+    def short(value):
+        if isinstance(value, (tuple, list)):
+            return '(' + ', '.join(short(item) for item in value) + ')'
+        return '{:.4g}'.format(value) if isinstance(value, float) else str(value)
+    for result in report[:top]:
+        print('{:>4}  error {:.4f}  found {:>4.0%}  {:>6.2f} ms/frame  {}'.format(
+            result['rank'], result['error'], result['found'], result['ms_per_frame'],
+            ', '.join('{}={}'.format(name, short(value)) for name, value in result.items() if name in SEARCH_SPACE)))
@@ -0,0 +1,91 @@
+"""Synthetic road frames, for benchmarks and checks that cannot rely on the test videos."""
+import time
+
+import cv2
+import numpy as np
+
+# (width, height) of the resolutions the benchmarks run at
+RESOLUTIONS = {
+    '540p': (960, 540),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '4K': (3840, 2160),
+}
+
+
+def synthetic_lane_lines(width, height, shift=0.):
+    """
+    Returns the [x1, y1, x2, y2] rows of the left and right lane lines of
+    synthetic_frame(), from the bottom of the frame up to the horizon.
+    `shift` moves the bottom of the lines sideways, as a fraction of the width.
+    """
+    lines = np.array([[0.2 + shift, 1., 0.465, 0.6],
+                      [0.9 + shift, 1., 0.555, 0.6]])
+    return lines * [width - 1, height - 1, width - 1, height - 1]
+
+
+def synthetic_frame(width=960, height=540, clutter=0, shift=0., seed=0):
+    """
+    Returns an RGB frame of a road, with a solid white lane line on the left
+    and a dashed yellow one on the right, see synthetic_lane_lines().
+
+    `clutter` random short strokes (cracks, tar lines, shadows) are added to the
+    road, each of them adds edges for Canny and segments for Hough.
+    """
+    rng = np.random.RandomState(seed)
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    # above the top of the lane lines, so the edge of the road stays out of the region of interest
+    horizon = int(0.55 * height)
+    frame[:horizon] = (135, 170, 205)
+    # asphalt with some texture, too weak to pass the Canny thresholds once blurred
+    asphalt = rng.normal(95, 6, (height - horizon, width)).clip(0, 255).astype(np.uint8)
+    frame[horizon:] = asphalt[..., None]
+
+    scale = width / 960.
+    for _ in range(clutter):
+        x = rng.uniform(0, width)
+        y = rng.uniform(horizon, height)
+        length = rng.uniform(15, 60) * scale
+        angle = rng.uniform(0, np.pi)
+        end = (int(x + length * np.cos(angle)), int(y + length * np.sin(angle)))
+        color = (40,) * 3 if rng.rand() < 0.5 else (170,) * 3
+        cv2.line(frame, (int(x), int(y)), end, color, max(1, int(2 * scale)))
+
+    thickness = max(2, int(10 * scale))
+    (left, right) = synthetic_lane_lines(width, height, shift)
+    cv2.line(frame, (int(left[0]), int(left[1])), (int(left[2]), int(left[3])), (235, 235, 235), thickness)
+    # dashes of an eighth of the visible line, with gaps of the same length
+    for start in np.arange(0, 1, 0.25):
+        x1, y1 = right[:2] + (right[2:] - right[:2]) * start
+        x2, y2 = right[:2] + (right[2:] - right[:2]) * (start + 0.125)
+        cv2.line(frame, (int(x1), int(y1)), (int(x2), int(y2)), (230, 190, 40), thickness)
+    return frame
+
+
+def write_synthetic_video(path, frame_count, width=960, height=540, fps=25):
+    """Writes `frame_count` synthetic frames, with the lanes slowly drifting sideways, to the video file `path`"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    # a handful of distinct frames keeps writing the video quick
+    frames = [cv2.cvtColor(synthetic_frame(width, height, 30, shift=0.005 * seed, seed=seed), cv2.COLOR_RGB2BGR)
+              for seed in range(10)]
+    for index in range(frame_count):
+        writer.write(frames[index * len(frames) // frame_count])
+    writer.release()
+
+
+def write_synthetic_stream(stream, frame_count, width=960, height=540, fps=25, clutter=30):
+    """
+    Writes `frame_count` synthetic frames as raw RGB to the binary file `stream`,
+    e.g. the stdin of `lanefind stream -`, at `fps` frames per second like a
+    camera would.
+    """
+    # a handful of distinct frames keeps the writer ahead of the frame rate
+    frames = [synthetic_frame(width, height, clutter, shift=0.005 * seed, seed=seed).tobytes() for seed in range(10)]
+    start = time.perf_counter()
+    for index in range(frame_count):
+        # a camera does not wait for the reader: a late frame is not made up for
+        delay = start + index / fps - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        stream.write(frames[index * len(frames) // frame_count])
+        stream.flush()
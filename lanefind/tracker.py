@@ -0,0 +1,125 @@
+"""Tracking the lane lines across the frames of a video."""
+import cv2
+import numpy as np
+
+from lanefind import profiling
+from lanefind.config import DEFAULT_CONFIG
+from lanefind.pipeline import (canny, draw_lane_lines, fit_lane_lines, gaussian_blur, grayscale, hough_segments,
+                               lane_color_mask, region_of_interest, roi_bounding_box, weighted_img)
+
+
+class LaneTracker:
+    """
+    Tracks the left and right lane lines across the frames of a video.
+
+    Each line is smoothed exponentially over the frames, with `smoothing`
+    as the weight of the previous estimate. The confidence of a side decays
+    by `confidence_decay` on every frame it is not found in. While both sides
+    are above `min_confidence`, the next frame is only searched within
+    `band_width` pixels of each line, otherwise in the whole region of interest.
+    A line found more than `max_jump` pixels away from a confident estimate is
+    ignored as noise.
+
+    `config` is the PipelineConfig of the search, its `downscale` is not used.
+
+    The frames must arrive in order: use clip.fl_image(tracker.process_image),
+    or process_video() with workers=1.
+    """
+
+    def __init__(self, smoothing=0.6, band_width=30, max_jump=60, min_confidence=0.5, confidence_decay=0.7,
+                 config=None):
+        self.smoothing = smoothing
+        self.band_width = band_width
+        self.max_jump = max_jump
+        self.min_confidence = min_confidence
+        self.confidence_decay = confidence_decay
+        self.config = config or DEFAULT_CONFIG
+        self.reset()
+
+    def reset(self):
+        """Forgets the tracked lines, e.g. before starting on another video"""
+        # one [x1, y1, x2, y2] row for the left and one for the right line,
+        # from the bottom of the image to the top of the region of interest
+        self.lines = np.full((2, 4), np.nan)
+        self.confidence = np.zeros(2)
+
+    def search_vertices(self, vertices):
+        """
+        Returns the polygons to search the next frame in: a band around each
+        tracked line, or the whole region of interest `vertices`.
+        """
+        if (self.confidence < self.min_confidence).any():
+            return vertices
+        # snap the bands to a grid, so that steady footage keeps hitting the mask cache
+        step = max(self.band_width // 3, 1)
+        bands = []
+        for x1, y1, x2, y2 in np.round(self.lines / step) * step:
+            bands.append([(x1 - self.band_width, y1), (x2 - self.band_width, y2),
+                          (x2 + self.band_width, y2), (x1 + self.band_width, y1)])
+        return np.array(bands, dtype=np.int32)
+
+    def update(self, lines, imshape, top_y):
+        """
+        Updates the tracked lines with the Hough segments `lines` of the next
+        frame, extrapolated from the bottom of the image up to `top_y`.
+        Returns the tracked lines.
+        """
+        bottom_y = imshape[0]
+        found_lines = np.full((2, 4), np.nan)
+        for x1, y1, x2, y2 in fit_lane_lines(lines, imshape):
+            if np.isnan(x1) or y1 == y2:
+                continue
+            # the left line leans to the right towards the top of the image
+            side = 0 if x2 > x1 else 1
+            if np.isnan(found_lines[side, 0]):
+                slope = (x2 - x1) / (y2 - y1)
+                found_lines[side] = [x1 + slope * (bottom_y - y1), bottom_y, x1 + slope * (top_y - y1), top_y]
+
+        for side in range(2):
+            found = not np.isnan(found_lines[side, 0])
+            tracked = not np.isnan(self.lines[side, 0])
+            if found and tracked and self.confidence[side] >= self.min_confidence \
+                    and np.abs(found_lines[side] - self.lines[side]).max() > self.max_jump:
+                found = False
+            if found and tracked:
+                self.lines[side] = self.smoothing * self.lines[side] + (1 - self.smoothing) * found_lines[side]
+            elif found:
+                self.lines[side] = found_lines[side]
+            self.confidence[side] = self.confidence_decay * self.confidence[side] + (1 - self.confidence_decay) * found
+        return self.lines
+
+    def process_image(self, image):
+        """Finds the lanes of the next frame like process_image(), and draws the tracked lines on it"""
+        with profiling.frame():
+            imshape = image.shape
+            params = self.config.pixels(imshape)
+            kernel_size = params.kernel_size
+            vertices = params.vertices
+
+            # only look at the bounding box of the polygons to search
+            search_vertices = self.search_vertices(vertices)
+            x1, y1, x2, y2 = roi_bounding_box(search_vertices, imshape, margin=kernel_size)
+            with profiling.stage('grayscale'):
+                gray = grayscale(image[y1:y2, x1:x2])
+            if self.config.color_filter:
+                with profiling.stage('color_filter'):
+                    gray = cv2.bitwise_and(gray, lane_color_mask(image[y1:y2, x1:x2], self.config.color_ranges))
+            with profiling.stage('gaussian_blur'):
+                blur_gray = gaussian_blur(gray, kernel_size)
+            with profiling.stage('canny'):
+                edges = canny(blur_gray, params.low_threshold, params.high_threshold)
+            with profiling.stage('region_of_interest'):
+                masked_edges = region_of_interest(edges, search_vertices - np.array([x1, y1], dtype=np.int32))
+                if profiling.active():
+                    profiling.count('edge_pixels', cv2.countNonZero(masked_edges))
+
+            lines = hough_segments(masked_edges, params.rho, params.theta, params.threshold, params.min_line_length,
+                                   params.max_line_gap, offset=(x1, y1), detector=self.config.detector)
+            with profiling.stage('update'):
+                self.update(lines, imshape, vertices[..., 1].min())
+
+            with profiling.stage('draw_lines'):
+                line_img = np.zeros((imshape[0], imshape[1], 3), dtype=np.uint8)
+                draw_lane_lines(line_img, self.lines)
+            with profiling.stage('weighted_img'):
+                return weighted_img(line_img, image)
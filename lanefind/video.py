@@ -0,0 +1,178 @@
+"""Streaming videos through the pipeline on a pool of worker processes."""
+import multiprocessing
+import threading
+import time
+
+import cv2
+
+from lanefind import profiling
+from lanefind.pipeline import process_image
+
+
+def process_frames_worker(frame_function, tasks, results, profile=None):
+    """
+    Applies `frame_function` to the (index, frame) tasks until it gets None.
+
+    `profile` is None, or the `track_allocations` argument of profiling.enable()
+    to send a profiling record back with every frame.
+    """
+    profiler = None if profile is None else profiling.enable(track_allocations=profile)
+    for index, frame in iter(tasks.get, None):
+        try:
+            with profiling.frame():
+                frame = frame_function(frame)
+            results.put((index, frame, profiler and profiler.frames.pop()))
+        except Exception as error:
+            results.put((index, error, None))
+
+def process_frames(frames, frame_function=process_image, workers=None, queue_depth=None):
+    """
+    Applies `frame_function` to every frame of `frames` on a pool of `workers` processes.
+
+    Yields the processed frames in the original order. At most `queue_depth`
+    frames are decoded but not yet yielded, so memory stays bounded however long
+    the video is. `workers` defaults to one per core, `queue_depth` to 4 frames
+    per worker. While profiling is enabled, the workers profile the frames and
+    their records are added to the active profiler in frame order.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    queue_depth = queue_depth or 4 * workers
+    tasks = multiprocessing.Queue(queue_depth)
+    results = multiprocessing.Queue()
+    # one slot per frame that has been decoded but not yet yielded
+    slots = threading.Semaphore(queue_depth)
+    stopped = threading.Event()
+    decode_errors = []
+
+    def decode():
+        frame_count = 0
+        try:
+            for frame in frames:
+                slots.acquire()
+                if stopped.is_set():
+                    break
+                tasks.put((frame_count, frame))
+                frame_count += 1
+        except Exception as error:
+            decode_errors.append(error)
+        finally:
+            # the decoder tells how many frames to expect once it is done
+            results.put((None, frame_count, None))
+
+    profiler = profiling.active()
+    profile = None if profiler is None else profiler.track_allocations
+    pool = [multiprocessing.Process(target=process_frames_worker, args=(frame_function, tasks, results, profile),
+                                    daemon=True) for _ in range(workers)]
+    for process in pool:
+        process.start()
+    decoder = threading.Thread(target=decode, daemon=True)
+    decoder.start()
+
+    reorder_buffer = {}
+    next_index = 0
+    frame_count = None
+    try:
+        while frame_count is None or next_index < frame_count:
+            index, frame, record = results.get()
+            if index is None:
+                frame_count = frame
+                continue
+            if isinstance(frame, Exception):
+                raise frame
+            reorder_buffer[index] = frame, record
+            while next_index in reorder_buffer:
+                frame, record = reorder_buffer.pop(next_index)
+                if profiler is not None and record is not None:
+                    profiler.add_frame(record)
+                yield frame
+                next_index += 1
+                slots.release()
+        if decode_errors:
+            raise decode_errors[0]
+    finally:
+        stopped.set()
+        slots.release()
+        if next_index == frame_count:
+            for process in pool:
+                tasks.put(None)
+            for process in pool:
+                process.join()
+        else:
+            # stopped early, frames may still be in flight
+            for process in pool:
+                process.terminate()
+            tasks.cancel_join_thread()
+            results.cancel_join_thread()
+        decoder.join()
+
+def read_video(path):
+    """Yields the BGR frames of the video file `path` decoded by OpenCV, all in the same reused array"""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise IOError('cannot read video file ' + path)
+    frame = None
+    try:
+        while True:
+            ok, frame = capture.read(frame)
+            if not ok:
+                break
+            yield frame
+    finally:
+        capture.release()
+
+def video_fps(path):
+    """Returns the frame rate of the video file `path`, as OpenCV reads it"""
+    capture = cv2.VideoCapture(path)
+    try:
+        return capture.get(cv2.CAP_PROP_FPS)
+    finally:
+        capture.release()
+
+def serial_frame(frame_function, frame):
+    """Applies `frame_function` to `frame` in this process, profiled like on a worker of process_frames()"""
+    with profiling.frame():
+        return frame_function(frame)
+
+def process_video(clip, output, frame_function=process_image, workers=None, queue_depth=None,
+                  profile=None, profile_allocations=False):
+    """
+    Streams `clip` through process_frames() and encodes the result to `output`.
+
+    `clip` is a VideoFileClip or the path of a video file. With `profile`, the
+    path of a .csv or .json file, the stages of every frame are profiled and
+    written to it, and a p50/p95/p99 summary is printed at the end.
+    `profile_allocations` adds the allocations of every stage to the profile.
+    With `workers=1` the frames are processed in this process, in order and
+    without a pool, as LaneTracker and AdaptiveLaneFinder need: their state
+    stays here, and the frames are not pickled to a worker and back.
+    Returns the end-to-end frames/sec, decoding and encoding included.
+    """
+    # moviepy takes long to import, only load it once a video is processed
+    from moviepy.video.io.VideoFileClip import VideoFileClip
+    from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+
+    if isinstance(clip, str):
+        clip = VideoFileClip(clip)
+    profiler = profiling.enable(profile_allocations) if profile else None
+    start = time.perf_counter()
+    writer = FFMPEG_VideoWriter(output, clip.size, clip.fps, codec='libx264')
+    frame_count = 0
+    try:
+        if workers == 1:
+            frames = (serial_frame(frame_function, frame) for frame in clip.iter_frames())
+        else:
+            frames = process_frames(clip.iter_frames(), frame_function, workers, queue_depth)
+        for frame in frames:
+            writer.write_frame(frame)
+            frame_count += 1
+    finally:
+        writer.close()
+        if profiler is not None:
+            profiling.disable()
+    frames_per_second = frame_count / (time.perf_counter() - start)
+    print('{}: {} frames, {:.1f} frames/sec with {} workers'.format(
+        output, frame_count, frames_per_second, workers or multiprocessing.cpu_count()))
+    if profiler is not None:
+        profiler.write(profile)
+        profiler.print_summary()
+    return frames_per_second